@@ -0,0 +1,59 @@
+# Python
+import sys
+import json
+import timeit
+from uuid import uuid4
+
+# App
+from main2 import Tweet, UserRegister
+from main2 import validate_tweet, validate_user_register, validate_lines
+
+# Compares the cost per record of the Pydantic models against the
+# lightweight validators of the /internal/ingest endpoint
+#
+#   python bench_ingest.py [records]
+
+def make_user():
+    return {
+        "user_id": str(uuid4()),
+        "email": "user@example.com",
+        "first_name": "Santiago",
+        "last_name": "Tellez",
+        "birth_date": "1990-05-17",
+        "password": "12345678"
+    }
+
+def make_tweet():
+    user = make_user()
+    del user["password"]
+    return {
+        "tweet_id": str(uuid4()),
+        "content": "This is a tweet with some content to validate",
+        "created_at": "2022-11-06 22:40:49.298553",
+        "updated_at": None,
+        "by": user,
+        "media": [str(uuid4())]
+    }
+
+def per_record(function, records):
+    seconds = min(timeit.repeat(lambda: [function(record) for record in records], number=1, repeat=5))
+    return seconds / len(records) * 1_000_000
+
+def main(count):
+    users = [make_user() for _ in range(count)]
+    tweets = [make_tweet() for _ in range(count)]
+    lines = [json.dumps({"type": "tweet", **tweet}) for tweet in tweets]
+
+    results = [
+        ("UserRegister (Pydantic)", per_record(lambda user: UserRegister(**user), users)),
+        ("validate_user_register", per_record(validate_user_register, users)),
+        ("Tweet (Pydantic)", per_record(lambda tweet: Tweet(**tweet), tweets)),
+        ("validate_tweet", per_record(validate_tweet, tweets)),
+        ("validate_lines (NDJSON)", per_record(lambda line: validate_lines([line]), lines))
+    ]
+    print(f"{count} records, microseconds per record")
+    for name, microseconds in results:
+        print(f"  {name:<26} {microseconds:8.2f} us")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -1,23 +1,129 @@
 # Python
+import os
+import gzip
+import zlib
+import re
 import json
+import asyncio
+import hmac
+import base64
+import hashlib
+import secrets
+import time
+import random
+import signal
+import logging
+import marshal
+import pstats
+import cProfile
+import threading
 from os import remove
-from uuid import UUID
+from uuid import UUID, uuid4
 from datetime import date
 from datetime import datetime
-from typing import Optional, List
+from io import StringIO, BytesIO
+from contextvars import ContextVar
+from contextlib import asynccontextmanager, ExitStack
+from functools import partial, wraps, lru_cache
+from collections import OrderedDict, deque
+from bisect import bisect_left, bisect_right, insort
+from typing import Optional, List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+
+# fcntl (only on POSIX, see lock_data_dir)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Pillow (optional, only needed for the media thumbnails)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# zstandard and brotli (optional, gzip is always available)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Pydantic
 from pydantic import BaseModel
 from pydantic import EmailStr
 from pydantic import Field
+from pydantic import ValidationError
+from pydantic import create_model
 
 # FastAPI
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi import status
 from fastapi import HTTPException
-from fastapi import Body, Form, Path
+from fastapi import Body, Form, Path, Query, Header, UploadFile, File, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, FileResponse, JSONResponse, PlainTextResponse
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+
+@asynccontextmanager
+async def lifespan(app):
+    start_up()
+    yield
+    await shut_down()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = "media"
+MEDIA_VARIANTS = {
+    "thumb": (150, 150),
+    "small": (480, 480),
+    "medium": (1024, 1024)
+}
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MEDIA_MAX_SIZE = 10 * 1024 * 1024
+MEDIA_TYPES = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"GIF87a": "image/gif",
+    b"GIF89a": "image/gif"
+}
+MEDIA_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+IDEMPOTENCY_TTL = 24 * 60 * 60
+IDEMPOTENCY_MAX_KEYS = 10000
+BATCH_MAX_IDS = 300
+RANGE_DEFAULT_LIMIT = 100
+RANGE_MAX_LIMIT = 1000
+PROFILING = os.environ.get("PROFILING") == "1"
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_MAX_KEEP = 50
+COMPACTION_INTERVAL = 30
+COMPACTION_BATCH_SIZE = 500
+WRITE_BATCH_WINDOW = 0.002
+SHUTDOWN_TIMEOUT = 30
+DATA_LOCK_FILE = "app.lock"
+STREAM_QUEUE_SIZE = 100
+STREAM_BUFFER_SIZE = 1000
+STREAM_KEEP_ALIVE = 15
+SECRET_KEY = os.environ.get("SECRET_KEY") or secrets.token_hex(32)
+TOKEN_TTL = 60 * 60
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN")
+INGEST_PARALLEL_LINES = 20000
+INGEST_CHUNK_LINES = 5000
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_THREAD_SIZE = 64 * 1024
+COMPRESSION_CACHE_SIZE = 64
+USER_CACHE_SIZE = 10000
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILES = ("users", "tweets", "media")
+SNAPSHOT_CHUNK_RECORDS = 1000
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html")
 
 # Models
 
@@ -59,13 +165,55 @@ class Tweet(BaseModel):
         min_length=1,
         max_length=256
     )
-    created_at: datetime = Field(default=datetime.now())
+    created_at: datetime = Field(default_factory=datetime.now)
     updated_at: Optional[datetime] = Field(default=None)
     by: User = Field(...)
+    media: List[UUID] = Field(default=[])
+
+class Media(BaseModel):
+    media_id: UUID = Field(...)
+    filename: str = Field(...)
+    content_type: str = Field(...)
+    size: int = Field(..., ge=0)
+    sha256: str = Field(...)
+    created_at: datetime = Field(...)
+    variants: Dict[str, str] = Field(default={})
+    variants_error: Optional[str] = Field(default=None)
+
+class UserBatchItem(BaseModel):
+    user_id: UUID = Field(...)
+    found: bool = Field(...)
+    user: Optional[User] = Field(default=None)
+
+class TweetBatchItem(BaseModel):
+    tweet_id: UUID = Field(...)
+    found: bool = Field(...)
+    tweet: Optional[Tweet] = Field(default=None)
+
+class UserStats(BaseModel):
+    user_id: UUID = Field(...)
+    tweets: int = Field(..., ge=0)
+    last_posted_at: Optional[datetime] = Field(default=None)
+
+class AppStats(BaseModel):
+    users: int = Field(..., ge=0)
+    tweets: int = Field(..., ge=0)
+    last_posted_at: Optional[datetime] = Field(default=None)
+
+class ProfileOut(BaseModel):
+    request_id: str = Field(...)
+    method: str = Field(...)
+    path: str = Field(...)
+    status_code: int = Field(...)
+    duration_ms: float = Field(...)
+    created_at: datetime = Field(...)
 
 class LoginOut(BaseModel): 
     email: EmailStr = Field(...)
     message: str = Field(default="Login Succesfully!")
+    access_token: Optional[str] = Field(default=None)
+    token_type: str = Field(default="bearer")
+    expires_at: Optional[datetime] = Field(default=None)
 
 # Auxiliar functions
 
@@ -73,36 +221,1792 @@ def read_data(file):
     with open(f"{file}.json", "r+", encoding="utf-8") as f:
         return json.loads(f.read())
 
+def fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def write_atomic(path, content):
+    """
+    Writes to a temporary file and moves it over the old one, so a crash in
+    the middle of a write never leaves a truncated file
+    """
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+    fsync_dir(path)
+
 def overwrite_data(file, result_list):
-    with open(f"{file}.json", "w", encoding="utf-8") as f:
-        f.seek(0)
-        f.write(json.dumps(result_list))
+    write_atomic(f"{file}.json", json.dumps(result_list))
 
-def show_data(file, id, info):
-    results = read_data(file)
-    id = str(id)
-    for data in results:
-        if data[f"{info}_id"] == id:
-            return data
+def optional_str(value):
+    return None if value is None else str(value)
+
+def read_tombstones(file):
+    try:
+        with open(f"{file}.deleted", "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+def append_tombstones(file, ids):
+    with open(f"{file}.deleted", "a", encoding="utf-8") as f:
+        f.write("".join(f"{id}\n" for id in ids))
+        f.flush()
+        os.fsync(f.fileno())
+
+def overwrite_tombstones(file, ids):
+    write_atomic(f"{file}.deleted", "".join(f"{id}\n" for id in ids))
+
+def salvage_array(text):
+    """
+    Returns the items of a json array up to the first broken one
+    """
+    decoder = json.JSONDecoder()
+    items = []
+    position = text.find("[") + 1
+    separators = re.compile(r"[\s,]*")
+    while position > 0:
+        position = separators.match(text, position).end()
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        items.append(item)
+    return items
+
+def recover_data(file):
+    """
+    Checks a json file and its tombstones on startup: removes the temporary
+    file of a write that didn't finish, and if the json is broken (torn by a
+    crash) keeps a copy of it and saves the records that can be read.
+    Returns a message for each repair.
+    """
+    repairs = []
+    path = f"{file}.json"
+    for leftover in (f"{path}.tmp", f"{file}.deleted.tmp"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+            repairs.append(f"{leftover}: removed an unfinished write")
+    if not os.path.exists(path):
+        overwrite_data(file, [])
+        repairs.append(f"{path}: created empty")
     else:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        try:
+            json.loads(text)
+        except ValueError:
+            backup = f"{path}.broken-{datetime.now():%Y%m%d%H%M%S}"
+            os.replace(path, backup)
+            items = salvage_array(text)
+            overwrite_data(file, items)
+            repairs.append(f"{path}: broken, kept {len(items)} records, the old file is {backup}")
+    tombstones = f"{file}.deleted"
+    if os.path.exists(tombstones):
+        with open(tombstones, "r", encoding="utf-8") as f:
+            text = f.read()
+        if text and not text.endswith("\n"):
+            write_atomic(tombstones, text[:text.rfind("\n") + 1])
+            repairs.append(f"{tombstones}: removed a torn last line")
+    return repairs
+
+def version_of(data):
+    return data.get("version", 1)
+
+def merge_patch(target, patch):
+    """
+    Applies a JSON merge patch (RFC 7386): the null values remove a key,
+    the objects are merged and anything else replaces the old value
+    """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+@lru_cache(maxsize=64)
+def patch_model(model, fields):
+    """
+    A model with only some fields of another one, to validate a patch
+    """
+    return create_model(
+        f"{model.__name__}Patch",
+        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields}
+    )
+
+def patch_data(file, id, info, model, patch, if_match, read_only, stamp=None):
+    """
+    Validates the patched fields with their fields of the model, not the
+    whole record (an old record can break rules that came later, like the
+    password length, and that mustn't block a patch of another field).
+    Writes only the fields that really changed, plus the stamp fields if
+    something changed. Returns the new record.
+    """
+    for key in read_only:
+        if key in patch:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"¡The {key} can't be changed!"
+            )
+    version = None
+    if if_match is not None and if_match.strip() != "*":
+        try:
+            version = int(if_match.strip().removeprefix("W/").strip('"'))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="¡The If-Match header must be a version number!"
+            )
+
+    current = show_data(file, id, info)
+    merged = merge_patch(current, patch)
+    fields = tuple(sorted(key for key in patch if key in model.model_fields))
+    try:
+        normalized = json.loads(patch_model(model, fields)(
+            **{key: merged[key] for key in fields if key in merged}
+        ).json())
+    except ValidationError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=json.loads(error.json())
+        )
+    changes = {
+        key: normalized.get(key) for key in fields
+        if normalized.get(key) != current.get(key)
+    }
+    if changes and stamp:
+        changes.update(stamp)
+    return stores[file].update(id, changes, version)
+
+class Store:
+    """
+    Keeps a json file in memory indexed by its id, so a lookup doesn't read
+    and parse the whole file again. Every change is still written to disk,
+    and then the listeners are called with the old and the new record
+    (old is None for an insert and new is None for a remove).
+
+    A remove only appends the id to the {file}.deleted tombstones and hides
+    the record from the reads; the compactor purges it from the json later,
+    or the insert does right away if the id is used again.
+
+    The json is written by a writer thread: the changes made while it writes
+    are saved together in its next write (group commit), and each change
+    waits, outside of the lock, until a write with fsync includes it.
+
+    The index is the only copy the writes start from, so only one process
+    can serve the files (see lock_data_dir): with uvicorn --workers N the
+    workers would overwrite each other's writes.
+    """
+
+    def __init__(self, file, info):
+        self.file = file
+        self.info = info
+        self.key = f"{info}_id"
+        self.lock = threading.RLock()
+        self.index = None
+        self.tombstones = set()
+        self.listeners = []
+        self.resets = []
+        self.generation = 0
+        self.saved = threading.Condition()
+        self.changes = 0
+        self.flushed = 0
+        self.write_error = None
+        self.flush_lock = threading.Lock()
+        self.writer = None
+        self.closing = False
+
+    def load(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    index = {
+                        data[self.key]: data for data in read_data(self.file)
+                    }
+                    # A crash during a compaction leaves tombstones of purged
+                    # records; kept, they would hide a new record with that id
+                    self.tombstones = read_tombstones(self.file) & index.keys()
+                    self.index = index
+        return self.index
+
+    def save(self):
+        """
+        Called with the lock, after changing the index. Returns the number of
+        the change, to wait for it with wait_saved once the lock is released.
+        """
+        with self.saved:
+            self.changes += 1
+            if self.writer is None:
+                self.writer = threading.Thread(
+                    target=self.write_loop, name=f"{self.file}-writer", daemon=True
+                )
+                self.writer.start()
+            self.saved.notify_all()
+            return self.changes
+
+    def check_open(self):
+        """
+        Called with the lock, before changing the index: once the store is
+        closed a change would never be saved, so it fails instead of waiting
+        """
+        if self.closing:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"¡The {self.file} are closed, the server is shutting down!"
+            )
+
+    def wait_saved(self, change):
+        with self.saved:
+            while self.flushed < change and self.write_error is None:
+                self.saved.wait()
+            if self.flushed < change:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"¡The {self.file} couldn't be saved!"
+                )
+
+    def flush(self):
+        """
+        Writes the index as it is now. The index is copied without the lock,
+        which is safe because the records are replaced and never changed in
+        place, and any change counted in `changes` is already in the index.
+        """
+        with self.flush_lock:
+            with self.saved:
+                change = self.changes
+            if change == self.flushed:
+                return
+            try:
+                overwrite_data(self.file, list(self.index.values()))
+            except OSError as error:
+                with self.saved:
+                    self.write_error = error
+                    self.saved.notify_all()
+                raise
+            with self.saved:
+                self.flushed = change
+                self.write_error = None
+                self.saved.notify_all()
+
+    def write_loop(self):
+        while True:
+            with self.saved:
+                while self.flushed == self.changes and not self.closing:
+                    self.saved.wait()
+                if self.closing and self.flushed == self.changes:
+                    return
+            time.sleep(WRITE_BATCH_WINDOW)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Couldn't save %s", self.file)
+                time.sleep(1)
+
+    def open(self):
+        """
+        Lets a closed store save again (a new startup of the app)
+        """
+        with self.saved:
+            self.closing = False
+            self.writer = None
+
+    def close(self):
+        """
+        Writes the pending changes and stops the writer thread. The changes
+        made after this fail with a 503 until the store is opened again.
+        """
+        with self.lock, self.saved:
+            self.closing = True
+            self.saved.notify_all()
+        if self.writer is not None:
+            self.writer.join()
+        if self.index is not None:
+            self.flush()
+
+    def notify(self, old, new):
+        self.generation += 1
+        for listener in self.listeners:
+            listener(old, new)
+
+    def all(self):
+        index = self.load()
+        if not self.tombstones:
+            return list(index.values())
+        return [data for id, data in index.items() if id not in self.tombstones]
+
+    def count(self):
+        return len(self.load()) - len(self.tombstones)
+
+    def get(self, id):
+        id = str(id)
+        if id in self.tombstones:
+            return None
+        return self.load().get(id)
+
+    def insert(self, data):
+        with self.lock:
+            index = self.load()
+            self.check_open()
+            if data[self.key] in self.tombstones:
+                self.purge([data[self.key]])
+            if data[self.key] in index:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"¡This {self.info} already exist!"
+                )
+            data["version"] = 1
+            index[data[self.key]] = data
+            change = self.save()
+            self.notify(None, data)
+        self.wait_saved(change)
+        return data
+
+    def put(self, id, data):
+        index = self.load()
+        self.check_open()
+        old = index.get(id)
+        data["version"] = version_of(old) + 1 if old is not None else 1
+        index[id] = data
+        change = self.save()
+        self.notify(old, data)
+        return change
+
+    def replace(self, id, data):
+        with self.lock:
+            change = self.put(str(id), data)
+        self.wait_saved(change)
+        return data
+
+    def update(self, id, changes, version=None):
+        """
+        Changes only the given fields of a record. With a version, the
+        record is only changed if nobody changed it since that version.
+        """
+        with self.lock:
+            old = self.get(id)
+            if old is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"¡This {self.info} doesn't exist!"
+                )
+            if version is not None and version != version_of(old):
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail=f"¡This {self.info} was changed, the version is {version_of(old)}!"
+                )
+            if not changes:
+                return old
+            data = {**old, **changes}
+            change = self.put(str(id), data)
+        self.wait_saved(change)
+        return data
+
+    def insert_many(self, records):
+        """
+        Inserts a batch with one write to disk. Returns the positions of the
+        records whose id already exists (in the store or before in the batch).
+        """
+        with self.lock:
+            index = self.load()
+            self.check_open()
+            deleted = [data[self.key] for data in records if data[self.key] in self.tombstones]
+            if deleted:
+                self.purge(deleted)
+            inserted, duplicated = [], []
+            for position, data in enumerate(records):
+                if data[self.key] in index:
+                    duplicated.append(position)
+                    continue
+                data["version"] = 1
+                index[data[self.key]] = data
+                inserted.append(data)
+            if not inserted:
+                return duplicated
+            change = self.save()
+            for data in inserted:
+                self.notify(None, data)
+        self.wait_saved(change)
+        return duplicated
+
+    def remove(self, id):
+        removed = self.remove_many([id])
+        return removed[0] if removed else None
+
+    def remove_many(self, ids):
+        with self.lock:
+            removed = [data for data in map(self.get, ids) if data is not None]
+            if removed:
+                removed_ids = [data[self.key] for data in removed]
+                append_tombstones(self.file, removed_ids)
+                self.tombstones.update(removed_ids)
+                for data in removed:
+                    self.notify(data, None)
+            return removed
+
+    def restore(self, records):
+        """
+        Replaces all the records with one write, instead of one per record.
+        The listeners aren't called per record: the indexes built from the
+        store are dropped (self.resets) and built again on the next read.
+        As in compact, the json is written before the tombstones are cleared,
+        so a crash in between can't bring back the deleted records.
+        """
+        with self.lock:
+            self.load()
+            self.check_open()
+            self.index = {data[self.key]: data for data in records}
+            self.save()
+            self.flush()
+            self.tombstones = set()
+            overwrite_tombstones(self.file, self.tombstones)
+            self.generation += 1
+            for reset in self.resets:
+                reset()
+            return len(self.index)
+
+    def compact(self, batch_size):
+        """
+        Purges up to batch_size tombstones from the json file. The json is
+        written before the tombstones, so a crash in between only leaves
+        tombstones of records that are already gone, which load() ignores.
+        """
+        with self.lock:
+            if not self.tombstones:
+                return 0
+            purged = list(self.tombstones)[:batch_size]
+            self.purge(purged)
+            return len(purged)
+
+    def purge(self, ids):
+        """
+        Called with the lock. Removes deleted records from the json and then
+        their tombstones, both written right away: an id can only be used
+        again once its old record is gone from the disk too, or a crash could
+        bring the old record back or hide the new one.
+        """
+        for id in ids:
+            self.index.pop(id, None)
+        self.save()
+        self.flush()
+        self.tombstones.difference_update(ids)
+        overwrite_tombstones(self.file, self.tombstones)
+
+stores = {
+    "users": Store("users", "user"),
+    "tweets": Store("tweets", "tweet"),
+    "media": Store("media", "media")
+}
+
+def show_data(file, id, info):
+    data = stores[file].get(id)
+    if data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"¡This {info} doesn't exist!"
         )
+    return data
 
 def delete_data(file, id, info):
-    results = read_data(file)
-    id = str(id)
-    for data in results:
-        if data[f"{info}_id"] == id:
-            results.remove(data)
-            overwrite_data(file, results)
-            return data
-    else:
+    data = stores[file].remove(id)
+    if data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"¡This {info} doesn't exist!"
         )
+    return data
+
+def batch_data(file, ids, info, hydrate=None):
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"¡Only {BATCH_MAX_IDS} ids can be requested at once!"
+        )
+    results = []
+    for id in ids:
+        data = stores[file].get(id)
+        if data is not None and hydrate is not None:
+            data = hydrate(data)
+        results.append({f"{info}_id": id, "found": data is not None, info: data})
+    return results
+
+def parse_datetime(value):
+    """
+    The json files mix naive and aware datetimes, so the aware ones are
+    moved to the local time to compare them with the naive ones
+    """
+    if value in (None, "None"):
+        return None
+    value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+## Stats
+
+class Stats:
+    """
+    Counters of users and tweets, computed once from the stores and then
+    kept up to date by the store listeners, so reading them is O(1).
+    Per user, and for all the tweets, it keeps the sorted creation dates,
+    so the last posted date is still right after deleting the newest tweet.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.posted = None
+        self.dates = []
+        self.users = 0
+        self.tweets = 0
+
+    def load(self):
+        """
+        Built with the locks of the stores, so no change is counted twice
+        or missed while the counters are computed
+        """
+        if self.posted is None:
+            with stores["users"].lock, stores["tweets"].lock, self.lock:
+                if self.posted is None:
+                    self.posted = {}
+                    self.dates = []
+                    self.users = stores["users"].count()
+                    self.tweets = 0
+                    for tweet in stores["tweets"].all():
+                        self.add_tweet(tweet)
+        return self.posted
+
+    def add_tweet(self, tweet):
+        dates = self.posted.setdefault(tweet["by"]["user_id"], [])
+        created_at = parse_datetime(tweet["created_at"])
+        insort(dates, created_at)
+        insort(self.dates, created_at)
+        self.tweets += 1
+
+    def remove_tweet(self, tweet):
+        dates = self.posted.get(tweet["by"]["user_id"], [])
+        created_at = parse_datetime(tweet["created_at"])
+        position = bisect_left(dates, created_at)
+        if position < len(dates) and dates[position] == created_at:
+            dates.pop(position)
+            self.dates.pop(bisect_left(self.dates, created_at))
+            self.tweets -= 1
+
+    def reset(self):
+        with self.lock:
+            self.posted = None
+            self.dates = []
+            self.users = 0
+            self.tweets = 0
+
+    def on_tweet_change(self, old, new):
+        if self.posted is None:
+            return
+        with self.lock:
+            if old is not None:
+                self.remove_tweet(old)
+            if new is not None:
+                self.add_tweet(new)
+
+    def on_user_change(self, old, new):
+        if self.posted is None:
+            return
+        with self.lock:
+            self.users += (new is not None) - (old is not None)
+
+    def user(self, user_id):
+        dates = self.load().get(str(user_id), [])
+        return {
+            "user_id": user_id,
+            "tweets": len(dates),
+            "last_posted_at": dates[-1] if dates else None
+        }
+
+    def totals(self):
+        self.load()
+        with self.lock:
+            return {
+                "users": self.users,
+                "tweets": self.tweets,
+                "last_posted_at": self.dates[-1] if self.dates else None
+            }
+
+stats = Stats()
+stores["tweets"].listeners.append(stats.on_tweet_change)
+stores["users"].listeners.append(stats.on_user_change)
+stores["tweets"].resets.append(stats.reset)
+stores["users"].resets.append(stats.reset)
+
+class GroupIndex:
+    """
+    Secondary index of a store: the ids of its records grouped by a key
+    (the tweets of each user), built once and kept by the listeners
+    """
+
+    def __init__(self, store, group_of):
+        self.store = store
+        self.group_of = group_of
+        self.lock = threading.RLock()
+        self.groups = None
+        store.listeners.append(self.on_change)
+        store.resets.append(self.reset)
+
+    def reset(self):
+        with self.lock:
+            self.groups = None
+
+    def load(self):
+        # With the store lock: a change during the build would be missed,
+        # as on_change ignores the changes until the groups exist
+        if self.groups is None:
+            with self.store.lock, self.lock:
+                if self.groups is None:
+                    groups = {}
+                    for data in self.store.all():
+                        groups.setdefault(self.group_of(data), set()).add(data[self.store.key])
+                    self.groups = groups
+        return self.groups
+
+    def on_change(self, old, new):
+        if self.groups is None:
+            return
+        with self.lock:
+            if old is not None:
+                self.groups.get(self.group_of(old), set()).discard(old[self.store.key])
+            if new is not None:
+                self.groups.setdefault(self.group_of(new), set()).add(new[self.store.key])
+
+    def get(self, group):
+        groups = self.load()
+        with self.lock:
+            return set(groups.get(str(group), ()))
+
+tweets_by_user = GroupIndex(stores["tweets"], lambda tweet: tweet["by"]["user_id"])
+media_by_sha256 = GroupIndex(stores["media"], lambda media: media["sha256"])
+
+class SortedIndex:
+    """
+    Secondary index of a store sorted by a datetime of its records, kept by
+    the listeners, so a range of time is found with bisect in O(log n + k)
+    """
+
+    def __init__(self, store, datetime_of):
+        self.store = store
+        self.datetime_of = datetime_of
+        self.lock = threading.RLock()
+        self.entries = None
+        store.listeners.append(self.on_change)
+        store.resets.append(self.reset)
+
+    def reset(self):
+        with self.lock:
+            self.entries = None
+
+    def entry(self, data):
+        try:
+            value = parse_datetime(self.datetime_of(data))
+        except (TypeError, ValueError):
+            return None
+        return None if value is None else (value, data[self.store.key])
+
+    def load(self):
+        # With the store lock, as GroupIndex.load
+        if self.entries is None:
+            with self.store.lock, self.lock:
+                if self.entries is None:
+                    entries = [self.entry(data) for data in self.store.all()]
+                    self.entries = sorted(entry for entry in entries if entry is not None)
+        return self.entries
+
+    def on_change(self, old, new):
+        if self.entries is None:
+            return
+        with self.lock:
+            entry = old is not None and self.entry(old)
+            if entry:
+                position = bisect_left(self.entries, entry)
+                if position < len(self.entries) and self.entries[position] == entry:
+                    self.entries.pop(position)
+            entry = new is not None and self.entry(new)
+            if entry:
+                insort(self.entries, entry)
+
+    def range(self, start=None, end=None, limit=None, after=None):
+        """
+        The ids with start <= datetime < end, oldest first. With after, a
+        (datetime, id) entry, only the ones that come after it.
+        """
+        entries = self.load()
+        with self.lock:
+            low = bisect_left(entries, (start,)) if start is not None else 0
+            if after is not None:
+                low = max(low, bisect_right(entries, after))
+            high = bisect_left(entries, (end,)) if end is not None else len(entries)
+            if limit is not None:
+                high = min(high, low + limit)
+            return [id for _, id in entries[low:high]]
+
+def format_cursor(entry):
+    value, id = entry
+    return f"{value.isoformat()}_{id}"
+
+def parse_cursor(cursor):
+    """
+    A cursor is the (datetime, id) of the last record of a page, so the next
+    page starts right after it even if many records share the datetime
+    """
+    try:
+        value, id = cursor.rsplit("_", 1)
+        return parse_datetime(value), str(UUID(id))
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="¡This cursor is not valid!"
+        )
+
+tweets_by_created_at = SortedIndex(stores["tweets"], lambda tweet: tweet["created_at"])
+tweets_by_changed_at = SortedIndex(
+    stores["tweets"], lambda tweet: tweet.get("updated_at") or tweet["created_at"]
+)
+
+## Tweets stream
+
+class Broadcaster:
+    """
+    In-process pub/sub of the tweets changes for the server-sent events.
+    Every event is serialized once and copied to a bounded queue per
+    subscriber; a subscriber whose queue is full is dropped, so a slow
+    client never makes the others wait. The last events are kept in a
+    buffer to resume a stream from its Last-Event-ID. The ids start with
+    an epoch of the process, so an id of before a restart isn't mistaken
+    for one of the new events.
+    """
+
+    def __init__(self, queue_size, buffer_size):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.epoch = uuid4().hex[:8]
+        self.last_id = 0
+        self.buffer = deque(maxlen=buffer_size)
+        self.subscribers = set()
+        self.loop = None
+        self.metrics = {"published": 0, "dropped": 0}
+
+    def publish(self, event, data):
+        with self.lock:
+            self.last_id += 1
+            id = self.last_id
+            message = (
+                f"id: {self.epoch}-{id}\n"
+                f"event: {event}\n"
+                f"data: {json.dumps(data)}\n\n"
+            )
+            self.buffer.append((self.last_id, message))
+            self.metrics["published"] += 1
+            loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.deliver, (id, message))
+
+    def deliver(self, item):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.drop(queue)
+
+    def drop(self, queue):
+        self.subscribers.discard(queue)
+        self.metrics["dropped"] += 1
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Returns the queue of the new subscriber and the events to replay.
+        If the Last-Event-ID is older than the buffer or of another epoch,
+        a reset event asks the client to fetch all the tweets again.
+        """
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        with self.lock:
+            buffer = list(self.buffer)
+            last_id = self.last_id
+        if last_event_id is None:
+            return queue, [], last_id
+        epoch, _, number = last_event_id.partition("-")
+        oldest = buffer[0][0] if buffer else last_id + 1
+        if epoch != self.epoch or not number.isdigit() or not oldest - 1 <= int(number) <= last_id:
+            reset = f"id: {self.epoch}-{last_id}\nevent: reset\ndata: {{}}\n\n"
+            return queue, [reset], last_id
+        last_event_id = int(number)
+        replay = [message for id, message in buffer if id > last_event_id]
+        return queue, replay, last_id
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def close(self):
+        for queue in list(self.subscribers):
+            self.drop(queue)
+
+broadcaster = Broadcaster(STREAM_QUEUE_SIZE, STREAM_BUFFER_SIZE)
+
+def publish_tweet_change(old, new):
+    if new is None:
+        broadcaster.publish("deleted", {"tweet_id": old["tweet_id"]})
+    elif old is None:
+        broadcaster.publish("created", new)
+    else:
+        broadcaster.publish("updated", new)
+
+def publish_tweets_reset():
+    broadcaster.publish("reset", {})
+
+stores["tweets"].listeners.append(publish_tweet_change)
+stores["tweets"].resets.append(publish_tweets_reset)
+
+## Session tokens
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def sign(payload):
+    digest = hmac.new(SECRET_KEY.encode("utf-8"), payload.encode("ascii"), hashlib.sha256)
+    return b64encode(digest.digest())
+
+def create_token(user):
+    """
+    The token carries the user in its signed claims, so checking it needs
+    no lookup in the users. Without a SECRET_KEY the tokens are only valid
+    until the app restarts.
+    """
+    now = time.time()
+    claims = {
+        "sub": user["user_id"],
+        "email": user["email"],
+        "iat": now,
+        "exp": now + TOKEN_TTL,
+        "jti": uuid4().hex
+    }
+    payload = b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{sign(payload)}", claims
+
+class RevokedTokens:
+    """
+    The tokens revoked before their expiration: one by one on logout, or
+    all the tokens of a user issued before a time (deleted user, new
+    password). The entries are forgotten once those tokens have expired.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.users = {}
+
+    def evict(self):
+        now = time.time()
+        for revoked in (self.tokens, self.users):
+            for key in [key for key, until in revoked.items() if until <= now]:
+                del revoked[key]
+
+    def revoke(self, claims):
+        with self.lock:
+            self.evict()
+            self.tokens[claims["jti"]] = claims["exp"]
+
+    def revoke_user(self, user_id):
+        with self.lock:
+            self.evict()
+            self.users[str(user_id)] = time.time() + TOKEN_TTL
+
+    def is_revoked(self, claims):
+        if claims["jti"] in self.tokens:
+            return True
+        until = self.users.get(claims["sub"])
+        return until is not None and claims["iat"] <= until - TOKEN_TTL
+
+revoked_tokens = RevokedTokens()
+
+def verify_token(token):
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, sign(payload)):
+            return None
+        claims = json.loads(b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if claims["exp"] <= time.time() or revoked_tokens.is_revoked(claims):
+        return None
+    return claims
+
+bearer = HTTPBearer(auto_error=False)
+
+def current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)
+):
+    claims = verify_token(credentials.credentials) if credentials else None
+    if claims is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="¡Invalid or expired token!",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return claims
+
+def check_owner(claims, user_id):
+    if claims["sub"] != str(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="¡This is not yours!"
+        )
+
+## Compaction
+
+compaction_stop = threading.Event()
+
+def compact_stores():
+    """
+    Runs in a background thread and purges the tombstones in small batches,
+    so a storm of deletes is spread over time and never blocks the app
+    """
+    while not compaction_stop.wait(COMPACTION_INTERVAL):
+        for store in stores.values():
+            if store.index is not None:
+                store.compact(COMPACTION_BATCH_SIZE)
+
+## Idempotency
+
+class IdempotencyCache:
+    """
+    Remembers the response sent for each Idempotency-Key, so a client that
+    retries a request gets the same response back without running it again.
+    The keys expire after a ttl; as every key lives the same time, the
+    oldest ones are always at the front and the eviction is O(1) per key.
+    It is only used from the event loop, so it doesn't need a lock.
+    """
+
+    def __init__(self, ttl, max_keys):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+
+    def evict(self):
+        now = time.monotonic()
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if entry["expires_at"] > now and len(self.entries) <= self.max_keys:
+                break
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        self.evict()
+        return self.entries.get(key)
+
+    def reserve(self, key, fingerprint):
+        self.entries[key] = {
+            "expires_at": time.monotonic() + self.ttl,
+            "fingerprint": fingerprint,
+            "response": None
+        }
+
+    def save(self, key, status_code, headers, content):
+        if key in self.entries:
+            self.entries[key]["response"] = (status_code, headers, content)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+idempotency_cache = IdempotencyCache(IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS)
+
+## Single flight
+
+class SingleFlight:
+    """
+    Lets the concurrent requests for the same key share one call: the first
+    one runs the function and the others wait for its result (or its error)
+    instead of doing the same lookup and serialization again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.metrics = {"requests": 0, "executions": 0, "coalesced": 0}
+
+    def do(self, key, function):
+        with self.lock:
+            self.metrics["requests"] += 1
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event()}
+                self.metrics["executions"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        if leader:
+            try:
+                call["result"] = function()
+            except Exception as error:
+                call["error"] = error
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call["done"].set()
+        else:
+            call["done"].wait()
+
+        if "error" in call:
+            raise call["error"]
+        return call["result"]
+
+single_flight = SingleFlight()
+
+def show_data_json(file, id, info, model, hydrate=None):
+    """
+    Same as show_data, but returns the response already serialized, so the
+    coalesced requests share the bytes too
+    """
+    def lookup():
+        data = show_data(file, id, info)
+        if hydrate is not None:
+            data = hydrate(data)
+        return model(**data).json().encode("utf-8"), version_of(data)
+
+    content, version = single_flight.do((file, str(id)), lookup)
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers={"ETag": f'"{version}"'}
+    )
+
+def list_data_json(file, model, if_none_match, hydrate=None):
+    """
+    Serializes all the records of a store once per change of the store,
+    with a weak ETag of its generation, so the same list isn't validated
+    and encoded again for every request (nor compressed, see below).
+    The records are hydrated with the users (see hydrate_tweet), so then
+    the list is serialized again when a user changes too.
+    """
+    store = stores[file]
+    with store.lock:
+        generation = str(store.generation)
+        if hydrate is not None:
+            generation += f"-{stores['users'].generation}"
+        cached = response_cache.get(file)
+        if cached is None or cached[0] != generation:
+            records = store.all()
+    etag = f'W/"{file}-{generation}"'
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    if cached is None or cached[0] != generation:
+        if hydrate is not None:
+            records = map(hydrate, records)
+        content = "[" + ",".join(model(**data).json() for data in records) + "]"
+        cached = response_cache[file] = (generation, content.encode("utf-8"))
+    return Response(content=cached[1], media_type="application/json", headers={"ETag": etag})
+
+response_cache = {}
+
+## User cache
+
+class UserCache:
+    """
+    LRU cache of the public data of the users, already validated and
+    serialized, for GET /users/{user_id} and the authors of the tweets.
+    It is a listener of the users store, so every change of a user (update,
+    patch, delete, ingest) drops its entry. The entries are filled with the
+    store lock, so an entry never outlives the change that drops it.
+    """
+
+    def __init__(self, store, max_size):
+        self.store = store
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        store.listeners.append(self.on_change)
+        store.resets.append(self.reset)
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+    def on_change(self, old, new):
+        if old is None:
+            return
+        with self.lock:
+            if self.entries.pop(old[self.store.key], None) is not None:
+                self.metrics["invalidations"] += 1
+
+    def get(self, id):
+        """
+        Returns (content, public data, version) of a user, or None
+        """
+        id = str(id)
+        with self.lock:
+            entry = self.entries.get(id)
+            if entry is not None:
+                self.entries.move_to_end(id)
+                self.metrics["hits"] += 1
+                return entry
+            self.metrics["misses"] += 1
+        with self.store.lock:
+            data = self.store.get(id)
+            if data is None:
+                return None
+            content = User(**data).json()
+            entry = (content.encode("utf-8"), json.loads(content), version_of(data))
+            with self.lock:
+                self.entries[id] = entry
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.metrics["evictions"] += 1
+        return entry
+
+    def author(self, id):
+        entry = self.get(id)
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="¡This user doesn't exist!"
+            )
+        return dict(entry[1])
+
+user_cache = UserCache(stores["users"], USER_CACHE_SIZE)
+
+def hydrate_tweet(tweet):
+    """
+    The `by` saved with a tweet is a copy of its author when it was written,
+    so the reads replace it with the current data of the user
+    """
+    entry = user_cache.get(tweet["by"]["user_id"])
+    if entry is None:
+        return tweet
+    return {**tweet, "by": entry[1]}
+
+## Admin
+
+def is_admin_token(x_admin_token):
+    return ADMIN_TOKEN is not None and x_admin_token is not None and hmac.compare_digest(
+        x_admin_token, ADMIN_TOKEN
+    )
+
+def check_admin_token(x_admin_token):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="¡This is only for the admins!"
+        )
+
+## Snapshots
+
+def take_snapshot():
+    """
+    Takes the records of all the stores at the same point in time. The
+    locks are held only to copy the lists of references: a change always
+    replaces a record with a new dict, never changes it in place, so the
+    copied records stay as they were while the writes go on.
+    """
+    with ExitStack() as stack:
+        for file in SNAPSHOT_FILES:
+            stack.enter_context(stores[file].lock)
+        return {file: stores[file].all() for file in SNAPSHOT_FILES}
+
+def iter_snapshot(snapshot):
+    """
+    Yields a snapshot as gzip NDJSON: a header line with the counts, then a
+    {"file", "data"} line per record, compressed SNAPSHOT_CHUNK_RECORDS at a time
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    header = {
+        "snapshot": SNAPSHOT_VERSION,
+        "created_at": str(datetime.now()),
+        "counts": {file: len(records) for file, records in snapshot.items()}
+    }
+    lines = [json.dumps(header)]
+    for file, records in snapshot.items():
+        for data in records:
+            lines.append(json.dumps({"file": file, "data": data}))
+            if len(lines) >= SNAPSHOT_CHUNK_RECORDS:
+                chunk = compressor.compress(("\n".join(lines) + "\n").encode("utf-8"))
+                lines = []
+                if chunk:
+                    yield chunk
+    yield compressor.compress(("\n".join(lines) + "\n").encode("utf-8")) + compressor.flush()
+
+class SnapshotReader:
+    """
+    Reads a snapshot made by iter_snapshot chunk by chunk, as it is
+    uploaded. Raises ValueError if it is broken or truncated.
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(31)
+        self.buffer = b""
+        self.header = None
+        self.records = {file: [] for file in SNAPSHOT_FILES}
+
+    def feed(self, chunk):
+        try:
+            lines = (self.buffer + self.decompressor.decompress(chunk)).split(b"\n")
+        except zlib.error:
+            raise ValueError("The snapshot is not a gzip file")
+        self.buffer = lines.pop()
+        for line in lines:
+            self.add_line(line)
+
+    def add_line(self, line):
+        if not line.strip():
+            return
+        item = json.loads(line)
+        if self.header is None:
+            if not isinstance(item, dict) or item.get("snapshot") != SNAPSHOT_VERSION:
+                raise ValueError("The snapshot version is not supported")
+            if not isinstance(item.get("counts"), dict):
+                raise ValueError("The snapshot header has no counts")
+            self.header = item
+            return
+        file = item.get("file") if isinstance(item, dict) else None
+        data = item.get("data") if isinstance(item, dict) else None
+        if (
+            file not in self.records
+            or not isinstance(data, dict)
+            or not isinstance(data.get(stores[file].key), str)
+        ):
+            raise ValueError(f"The snapshot has an unknown record: {line[:100]!r}")
+        self.records[file].append(data)
+
+    def close(self):
+        self.feed(b"")
+        self.add_line(self.buffer + self.decompressor.flush())
+        if not self.decompressor.eof or self.header is None:
+            raise ValueError("The snapshot is truncated")
+        for file, records in self.records.items():
+            if self.header["counts"].get(file, 0) != len(records):
+                raise ValueError(f"The snapshot is truncated, the {file} are incomplete")
+        return self.records
+
+def restore_snapshot(records):
+    return {file: stores[file].restore(records[file]) for file in SNAPSHOT_FILES}
+
+## Compression
+
+ENCODINGS = [
+    encoding for encoding, library in (
+        ("zstd", zstandard), ("br", brotli), ("gzip", gzip)
+    ) if library is not None
+]
+compressed_cache = OrderedDict()
+
+def compress(body, encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def choose_encoding(accept_encoding):
+    """
+    Picks the encoding with the best q value of the Accept-Encoding header,
+    and on a tie the first one of ENCODINGS (the smallest output)
+    """
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip()] = quality
+    candidates = [
+        (accepted.get(encoding, accepted.get("*", 0.0)), -position, encoding)
+        for position, encoding in enumerate(ENCODINGS)
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+## Profiling
+
+current_profiles = ContextVar("current_profiles", default=None)
+profiles = OrderedDict()
+profiles_lock = threading.Lock()
+# Only one request is profiled at a time: a second cProfile enabled in the
+# event loop replaces the hook of the first one (and on Python 3.12+ any
+# second profile, in any thread, raises)
+profiling_lock = threading.Lock()
+
+def profiled(endpoint):
+    """
+    A cProfile only sees the thread where it is enabled, and the sync path
+    operations run in the threadpool, so the endpoint itself gets its own
+    profile that is merged later with the one of the middleware
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        segments = current_profiles.get()
+        if segments is None:
+            return endpoint(*args, **kwargs)
+        profile = cProfile.Profile()
+        segments.append(profile)
+        profile.enable()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profile.disable()
+
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+app.router.route_class = ProfiledRoute
+
+def save_profile(request_id, request, status_code, duration, segments):
+    stats = pstats.Stats(segments[0])
+    for profile in segments[1:]:
+        stats.add(profile)
+    profile = {
+        "request_id": request_id,
+        "method": request.method,
+        "path": request.url.path,
+        "status_code": status_code,
+        "duration_ms": round(duration * 1000, 3),
+        "created_at": datetime.now(),
+        "stats": stats
+    }
+    with profiles_lock:
+        profiles[request_id] = profile
+        while len(profiles) > PROFILING_MAX_KEEP:
+            profiles.popitem(last=False)
+
+## Process pool
+
+process_pool = None
+
+def get_process_pool():
+    """
+    The CPU heavy work (thumbnails, big ingest batches) runs in this pool,
+    so it doesn't hold the GIL of the request workers
+    """
+    global process_pool
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return process_pool
+
+## Ingest validation
+
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-?([0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12}")
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+def is_uuid(value):
+    return isinstance(value, str) and UUID_PATTERN.fullmatch(value) is not None
+
+def canonical_uuid(value):
+    """
+    The form of str(UUID), the one used by the path operations to look up
+    the records, so "ABC…" and "abc…" can't be saved as two records
+    """
+    return str(UUID(value))
+
+def is_email(value):
+    return isinstance(value, str) and len(value) <= 254 and EMAIL_PATTERN.fullmatch(value) is not None
+
+def is_date(value):
+    try:
+        date.fromisoformat(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def is_datetime(value):
+    try:
+        datetime.fromisoformat(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def string(min_length, max_length):
+    def check(value):
+        return isinstance(value, str) and min_length <= len(value) <= max_length
+    return check
+
+def list_of(check):
+    def check_list(value):
+        return isinstance(value, list) and all(map(check, value))
+    return check_list
+
+def compile_schema(fields):
+    """
+    Compiles {field: (required, check)} into one validator that returns
+    None for a valid record or the error message. It only checks what the
+    Pydantic models check, without building any object, for the trusted
+    ingest where Pydantic's cost per record dominates.
+    """
+    checks = tuple((name, required, check) for name, (required, check) in fields.items())
+
+    def validate(record):
+        if not isinstance(record, dict):
+            return "The record must be an object"
+        for name, required, check in checks:
+            value = record.get(name)
+            if value is None:
+                if required:
+                    return f"{name} is required"
+            elif not check(value):
+                return f"{name} is not valid"
+        return None
+
+    return validate
+
+USER_FIELDS = {
+    "user_id": (True, is_uuid),
+    "email": (True, is_email),
+    "first_name": (True, string(1, 50)),
+    "last_name": (True, string(1, 50)),
+    "birth_date": (False, is_date)
+}
+validate_user = compile_schema(USER_FIELDS)
+validate_user_register = compile_schema({**USER_FIELDS, "password": (True, string(8, 64))})
+validate_tweet = compile_schema({
+    "tweet_id": (True, is_uuid),
+    "content": (True, string(1, 256)),
+    "created_at": (False, is_datetime),
+    "updated_at": (False, is_datetime),
+    "by": (True, lambda by: validate_user(by) is None),
+    "media": (False, list_of(is_uuid))
+})
+INGEST_VALIDATORS = {
+    "user": (validate_user_register, "users"),
+    "tweet": (validate_tweet, "tweets")
+}
+
+def validate_lines(lines, first_line=1):
+    """
+    Validates a batch of NDJSON lines in one pass. It is a plain function of
+    plain data, so big batches can be split between the process pool.
+    Returns the valid records by file and the errors by line number.
+    """
+    records = {"users": [], "tweets": []}
+    errors = []
+    now = str(datetime.now())
+    for number, line in enumerate(lines, start=first_line):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record.pop("type")
+            validate, file = INGEST_VALIDATORS[kind]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            errors.append({"line": number, "error": "Not a json object with a valid type"})
+            continue
+        error = validate(record)
+        if error is not None:
+            errors.append({"line": number, "error": error})
+            continue
+        if file == "tweets":
+            record["tweet_id"] = canonical_uuid(record["tweet_id"])
+            record["by"] = {**record["by"], "user_id": canonical_uuid(record["by"]["user_id"])}
+            record["media"] = [canonical_uuid(media_id) for media_id in record.get("media") or []]
+            record.setdefault("created_at", now)
+            record.setdefault("updated_at", None)
+        else:
+            record["user_id"] = canonical_uuid(record["user_id"])
+            record.setdefault("birth_date", None)
+        record["_line"] = number
+        records[file].append(record)
+    return records, errors
+
+## Media storage
+
+media_lock = threading.Lock()
+
+def detect_image_type(content):
+    """
+    The type of an image from its first bytes, never from the client (an
+    image/svg+xml upload could run scripts in the origin of the app).
+    Only raster images are accepted; returns None for anything else.
+    """
+    for signature, content_type in MEDIA_TYPES.items():
+        if content.startswith(signature):
+            return content_type
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def check_image(content):
+    """
+    With Pillow, an upload that only has the first bytes of an image (a
+    truncated or broken file) is rejected before it is saved, instead of
+    failing later in the process pool
+    """
+    if Image is None:
+        return True
+    try:
+        with Image.open(BytesIO(content)) as image:
+            image.verify()
+    except Exception:
+        return False
+    return True
+
+def make_variants(path, sha256):
+    """
+    Runs inside the process pool, so the resizing never blocks the request
+    workers. Returns a dict with the variant name and the file it was saved in.
+    """
+    variants = {}
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        for name, size in MEDIA_VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail(size)
+            filename = f"{sha256}_{name}.jpg"
+            variant.save(os.path.join(MEDIA_DIR, filename), "JPEG", quality=85)
+            variants[name] = filename
+    return variants
+
+def save_variants(media_id, future):
+    """
+    Saves the variants made in the process pool, or the error when Pillow
+    couldn't make them, so show_a_media doesn't say they are on the way
+    """
+    error = future.exception()
+    if error is not None:
+        logger.error("Couldn't make the variants of the media %s", media_id, exc_info=error)
+        changes = {"variants_error": f"{type(error).__name__}: {error}"}
+    else:
+        changes = {"variants": future.result()}
+    with media_lock:
+        media = stores["media"].get(media_id)
+        if media is not None:
+            stores["media"].replace(media_id, {**media, **changes})
+
+def send_file(path, content_type, etag, range_header=None, if_none_match=None):
+    """
+    Sends a stored media file with cache headers. The files never change
+    (they are named by their hash), so they are cached forever and a single
+    byte range is supported for resumable downloads.
+    """
+    if content_type not in MEDIA_CONTENT_TYPES:
+        # Saved before the types were checked
+        content_type = "application/octet-stream"
+    headers = {
+        "Cache-Control": MEDIA_CACHE_CONTROL,
+        "ETag": f'"{etag}"',
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "default-src 'none'"
+    }
+    if if_none_match == f'"{etag}"':
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if range_header is None:
+        return FileResponse(path, media_type=content_type, headers=headers)
+
+    size = os.path.getsize(path)
+    try:
+        unit, ranges = range_header.split("=", 1)
+        start, end = ranges.split(",")[0].strip().split("-", 1)
+        if unit.strip() != "bytes" or (start == "" and end == ""):
+            raise ValueError
+        if start == "":
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        if start > end or start >= size:
+            raise ValueError
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers=headers
+        )
+    with open(path, "rb") as f:
+        f.seek(start)
+        content = f.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(
+        content=content,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=content_type,
+        headers=headers
+    )
+
+# Middlewares
+
+@app.middleware("http")
+async def idempotency(request: Request, call_next):
+    key = request.headers.get("Idempotency-Key")
+    if key is None or request.method not in ("POST", "PUT", "PATCH", "DELETE"):
+        return await call_next(request)
+
+    caller = hashlib.sha256(request.headers.get("Authorization", "").encode()).hexdigest()
+    key = f"{request.method} {request.url.path} {caller} {key}"
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    entry = idempotency_cache.get(key)
+    if entry is not None:
+        if entry["fingerprint"] != fingerprint:
+            return JSONResponse(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                content={"detail": "¡This Idempotency-Key was used with another request!"}
+            )
+        if entry["response"] is None:
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={"detail": "¡This request is still in progress!"}
+            )
+        status_code, headers, content = entry["response"]
+        return Response(
+            content=content,
+            status_code=status_code,
+            headers={**headers, "Idempotent-Replayed": "true"}
+        )
+
+    idempotency_cache.reserve(key, fingerprint)
+    try:
+        response = await call_next(request)
+        content = b"".join([chunk async for chunk in response.body_iterator])
+    except Exception:
+        idempotency_cache.discard(key)
+        raise
+    headers = dict(response.headers)
+    if response.status_code < 500:
+        idempotency_cache.save(key, response.status_code, headers, content)
+    else:
+        idempotency_cache.discard(key)
+    return Response(content=content, status_code=response.status_code, headers=headers)
+
+async def profile_requests(request: Request, call_next):
+    """
+    Profiles the requests with the X-Profile: 1 header (and the admin
+    token, so a client can't make the server profile its requests) and a
+    sample of the others, one at a time: while a request is profiled the
+    others aren't (an asked one gets X-Profile-Skipped). The event loop
+    part of the profile can include some work of other requests running
+    at the same time.
+    """
+    asked = request.headers.get("X-Profile") == "1" and is_admin_token(
+        request.headers.get("X-Admin-Token")
+    )
+    if not asked and (
+        PROFILING_SAMPLE_RATE <= 0 or random.random() >= PROFILING_SAMPLE_RATE
+    ):
+        return await call_next(request)
+    if not profiling_lock.acquire(blocking=False):
+        response = await call_next(request)
+        if asked:
+            response.headers["X-Profile-Skipped"] = "another request is being profiled"
+        return response
+
+    request_id = uuid4().hex
+    profile = cProfile.Profile()
+    segments = [profile]
+    token = current_profiles.set(segments)
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        response = await call_next(request)
+    finally:
+        profile.disable()
+        current_profiles.reset(token)
+        profiling_lock.release()
+    duration = time.perf_counter() - start
+    save_profile(request_id, request, response.status_code, duration, segments)
+    response.headers["X-Profile-ID"] = request_id
+    return response
+
+if PROFILING:
+    app.middleware("http")(profile_requests)
+
+@app.middleware("http")
+async def compress_responses(request: Request, call_next):
+    """
+    Compresses the json and text responses bigger than COMPRESSION_MIN_SIZE
+    with the best encoding accepted by the client. The big ones are
+    compressed in the threadpool to keep the event loop free, and the
+    responses with an ETag keep their compressed bytes in a small LRU cache.
+    """
+    response = await call_next(request)
+    content_type = response.headers.get("content-type", "")
+    if (
+        response.status_code != status.HTTP_200_OK
+        or "content-encoding" in response.headers
+        or not content_type.startswith(COMPRESSIBLE_TYPES)
+    ):
+        return response
+    headers = dict(response.headers)
+    headers["vary"] = "Accept-Encoding"
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        return Response(content=body, status_code=response.status_code, headers=headers)
+
+    etag = headers.get("etag")
+    # The versions of a record can repeat (a record created again with its
+    # id, a restore), so the key has a digest of the body, not only the ETag
+    key = (request.url.path, etag, encoding, hashlib.blake2b(body, digest_size=16).digest())
+    compressed = compressed_cache.get(key) if etag else None
+    if compressed is not None:
+        compressed_cache.move_to_end(key)
+    else:
+        if len(body) >= COMPRESSION_THREAD_SIZE:
+            compressed = await run_in_threadpool(compress, body, encoding)
+        else:
+            compressed = compress(body, encoding)
+        if etag:
+            compressed_cache[key] = compressed
+            while len(compressed_cache) > COMPRESSION_CACHE_SIZE:
+                compressed_cache.popitem(last=False)
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+    headers["content-encoding"] = encoding
+    headers["content-length"] = str(len(compressed))
+    return Response(content=compressed, status_code=response.status_code, headers=headers)
+
+draining = threading.Event()
+in_flight = 0
+
+@app.middleware("http")
+async def drain_requests(request: Request, call_next):
+    """
+    Counts the requests in flight, so the shutdown can wait for them, and
+    answers 503 to the new ones once the shutdown started
+    """
+    global in_flight
+    if draining.is_set():
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "¡The server is shutting down!"},
+            headers={"Retry-After": "5"}
+        )
+    in_flight += 1
+    try:
+        return await call_next(request)
+    finally:
+        in_flight -= 1
 
 # Path Operations
 
@@ -133,12 +2037,10 @@ def signup(user: UserRegister = Body(...)):
         - last_name: str
         - birth_date: datetime
     """
-    results = read_data("users")
     user_dict = user.dict()
     user_dict["user_id"] = str(user_dict["user_id"])
-    user_dict["birth_date"] = str(user_dict["birth_date"])
-    results.append(user_dict)
-    overwrite_data("users", results)
+    user_dict["birth_date"] = optional_str(user_dict["birth_date"])
+    stores["users"].insert(user_dict)
     return user
 
 
@@ -161,15 +2063,42 @@ def login(email: EmailStr = Form(...), password: str = Form(...)):
         - email: EmailStr
         - password: str
 
-    Returns a LoginOut model with username and message
+    Returns a LoginOut model with username, message and the access token
+    to send in the Authorization: Bearer header
     """
-    data = read_data("users")
-    for user in data:
+    for user in stores["users"].all():
         if email == user['email'] and password == user['password']:
-            return LoginOut(email=email)
+            token, claims = create_token(user)
+            return LoginOut(
+                email=email,
+                access_token=token,
+                expires_at=datetime.fromtimestamp(claims["exp"])
+            )
     else:
         return LoginOut(email=email, message="Login Unsuccesfully!")
 
+### Logout a user
+@app.post(
+    path="/logout",
+    response_model=LoginOut,
+    status_code=status.HTTP_200_OK,
+    summary="Logout a User",
+    tags=["Users"]
+)
+def logout(claims: dict = Depends(current_user)):
+    """
+    Logout
+
+    This path operation revoke the access token of the request
+
+    Parameters:
+    - Authorization header: Bearer token
+
+    Returns a LoginOut model with username and message
+    """
+    revoked_tokens.revoke(claims)
+    return LoginOut(email=claims["email"], message="Logout Succesfully!")
+
 ### Show all users
 @app.get(
     path="/users",
@@ -178,7 +2107,7 @@ def login(email: EmailStr = Form(...), password: str = Form(...)):
     summary="Show all users",
     tags=["Users"]
 )
-def show_all_users():
+def show_all_users(if_none_match: Optional[str] = Header(default=None)):
     """
     Show all Users
 
@@ -194,7 +2123,38 @@ def show_all_users():
         - last_name: str
         - birth_date: datetime
     """
-    return read_data("users")
+    return list_data_json("users", User, if_none_match)
+
+### Show many users
+@app.get(
+    path="/users:batch",
+    response_model=List[UserBatchItem],
+    status_code=status.HTTP_200_OK,
+    summary="Show many users",
+    tags=["Users"]
+)
+def show_many_users(
+    ids: List[UUID] = Query(
+        ...,
+        title="User IDs",
+        description=f"The users IDs, up to {BATCH_MAX_IDS}"
+    )
+):
+    """
+    Show many Users
+
+    This path operation shows many users in one request, in the same order
+    of the ids. The ids that don't exist are reported with found = false
+
+    Parameters:
+        - ids: List[UUID]
+
+    Returns a json list with one item per id:
+        - user_id: UUID
+        - found: bool
+        - user: Optional[User]
+    """
+    return batch_data("users", ids, "user")
 
 ## Show a user
 @app.get(
@@ -227,7 +2187,50 @@ def show_a_user(
         - last_name: str
         - birth_date: datetime
     """
-    return show_data("users", user_id, "user")
+    entry = user_cache.get(user_id)
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="¡This user doesn't exist!"
+        )
+    return Response(
+        content=entry[0],
+        media_type="application/json",
+        headers={"ETag": f'"{entry[2]}"'}
+    )
+
+### Show the stats of a user
+@app.get(
+    path="/users/{user_id}/stats",
+    response_model=UserStats,
+    status_code=status.HTTP_200_OK,
+    summary="Show the stats of a User",
+    tags=["Users"]
+)
+def show_user_stats(
+    user_id: UUID = Path(
+        ...,
+        title="User ID",
+        description="This is the user ID",
+        example="3fa85f64-5717-4562-b3fc-2c963f66afa6"
+    )
+):
+    """
+    Show the Stats of a User
+
+    This path operation shows the tweets count of a user, from counters
+    that are updated on every post, update and delete
+
+    Parameters:
+        - user_id: UUID
+
+    Returns a json with:
+        - user_id: UUID
+        - tweets: int
+        - last_posted_at: Optional[datetime]
+    """
+    show_data("users", user_id, "user")
+    return stats.user(user_id)
 
 ### Delete a user
 @app.delete(
@@ -243,12 +2246,13 @@ def delete_a_user(
         title="User ID",
         description="This is the user ID",
         example="3fa85f64-5717-4562-b3fc-2c963f66afa9"
-    )
+    ),
+    claims: dict = Depends(current_user)
 ):
     """
     Delete a User
 
-    This path operation delete a user in the app
+    This path operation delete a user in the app, and all of its tweets
 
     Parameters:
         - user_id: UUID
@@ -260,7 +2264,11 @@ def delete_a_user(
         - last_name: str
         - birth_date: datetime
     """
-    return delete_data("users", user_id, "user")
+    check_owner(claims, user_id)
+    user = delete_data("users", user_id, "user")
+    stores["tweets"].remove_many(tweets_by_user.get(user_id))
+    revoked_tokens.revoke_user(user_id)
+    return user
 
 ### Update a user
 @app.put(
@@ -277,7 +2285,8 @@ def update_a_user(
         description="This is the user ID",
         example="3fa85f64-5717-4562-b3fc-2c963f66afa6"
     ),
-    user: UserRegister = Body(...)
+    user: UserRegister = Body(...),
+    claims: dict = Depends(current_user)
 ):
     """
     Update User
@@ -291,21 +2300,65 @@ def update_a_user(
     
     Returns a user model with user_id, email, first_name, last_name and birth_date
     """
-    user_id = str(user_id)
-    user_dict = user.dict()
-    user_dict["user_id"] = str(user_dict["user_id"])
-    user_dict["birth_date"] = str(user_dict["birth_date"])
-    results = read_data("users")
-    for user in results:
-        if user["user_id"] == user_id:
-            results[results.index(user)] = user_dict
-            overwrite_data('users', results)
-            return user
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="¡This user doesn't exist!"
-        )
+    check_owner(claims, user_id)
+    user_id = str(user_id)
+    user_dict = user.dict()
+    user_dict["user_id"] = str(user_dict["user_id"])
+    user_dict["birth_date"] = optional_str(user_dict["birth_date"])
+    user_dict["user_id"] = user_id
+    old = show_data("users", user_id, "user")
+    user = stores["users"].replace(user_id, user_dict)
+    if user["password"] != old["password"]:
+        revoked_tokens.revoke_user(user_id)
+    return user
+
+### Patch a user
+@app.patch(
+    path="/users/{user_id}",
+    response_model=User,
+    status_code=status.HTTP_200_OK,
+    summary="Patch a User",
+    tags=["Users"]
+)
+def patch_a_user(
+    response: Response,
+    user_id: UUID = Path(
+        ...,
+        title="User ID",
+        description="This is the user ID",
+        example="3fa85f64-5717-4562-b3fc-2c963f66afa6"
+    ),
+    patch: Dict[str, Any] = Body(
+        ...,
+        media_type="application/merge-patch+json",
+        example={"first_name": "Santiago"}
+    ),
+    if_match: Optional[str] = Header(default=None),
+    claims: dict = Depends(current_user)
+):
+    """
+    Patch User
+
+    This path operation change only the given fields of a user, with a
+    JSON merge patch. With an If-Match header the user is only changed
+    if its version (the ETag of GET /users/{user_id}) is still the same
+
+    Parameters:
+    - user_id: UUID
+    - Request body parameter:
+        - **patch: dict** -> The fields to change, null removes the optional ones
+    - If-Match header: the expected version
+
+    Returns a user model with user_id, email, first_name, last_name and birth_date
+    """
+    check_owner(claims, user_id)
+    user = patch_data(
+        "users", user_id, "user", UserRegister, patch, if_match, ["user_id"]
+    )
+    if "password" in patch:
+        revoked_tokens.revoke_user(user_id)
+    response.headers["ETag"] = f'"{version_of(user)}"'
+    return user
 
 ## Tweets
 
@@ -317,7 +2370,7 @@ def update_a_user(
     summary="Show all tweets",
     tags=["Tweets"]
 )
-def home():
+def home(if_none_match: Optional[str] = Header(default=None)):
     """
     Show all Tweets
 
@@ -333,7 +2386,84 @@ def home():
         updated_at: Optional[datetime]
         by: User
     """
-    return read_data("tweets")
+    return list_data_json("tweets", Tweet, if_none_match, hydrate_tweet)
+
+### Show the tweets in a time range
+@app.get(
+    path="/tweets",
+    response_model=List[Tweet],
+    status_code=status.HTTP_200_OK,
+    summary="Show the tweets in a time range",
+    tags=["Tweets"]
+)
+def show_tweets_in_range(
+    response: Response,
+    since: Optional[datetime] = Query(
+        default=None,
+        description="Only the tweets created at or after this time"
+    ),
+    until: Optional[datetime] = Query(
+        default=None,
+        description="Only the tweets created before this time"
+    ),
+    updated_since: Optional[datetime] = Query(
+        default=None,
+        description="Only the tweets created or updated at or after this time"
+    ),
+    limit: int = Query(
+        default=RANGE_DEFAULT_LIMIT,
+        ge=1,
+        le=RANGE_MAX_LIMIT
+    ),
+    cursor: Optional[str] = Query(
+        default=None,
+        description="The X-Next-Cursor of the last page"
+    )
+):
+    """
+    Show the Tweets in a time range
+
+    This path operation shows the tweets of a time range, oldest first, from
+    sorted indexes of the creation and update dates, so the sync clients
+    only download what changed since their last sync. A full page has an
+    X-Next-Cursor header; the next page is asked with the same parameters
+    and that cursor
+
+    Parameters:
+        - since: Optional[datetime]
+        - until: Optional[datetime]
+        - updated_since: Optional[datetime]
+        - limit: int
+        - cursor: Optional[str]
+
+    Returns a json list with the tweets, with the followings keys:
+        tweet_id: UUID
+        content: str
+        created_at: datetime
+        updated_at: Optional[datetime]
+        by: User
+        media: List[UUID]
+    """
+    since, until, updated_since = map(parse_datetime, (since, until, updated_since))
+    after = parse_cursor(cursor) if cursor is not None else None
+    results = []
+    if updated_since is None:
+        index = tweets_by_created_at
+        ids = index.range(since, until, limit, after)
+        results = [tweet for tweet in map(stores["tweets"].get, ids) if tweet is not None]
+    else:
+        index = tweets_by_changed_at
+        for tweet in map(stores["tweets"].get, index.range(updated_since, after=after)):
+            if tweet is None:
+                continue
+            created_at = parse_datetime(tweet["created_at"])
+            if (since is None or created_at >= since) and (until is None or created_at < until):
+                results.append(tweet)
+                if len(results) == limit:
+                    break
+    if len(results) == limit:
+        response.headers["X-Next-Cursor"] = format_cursor(index.entry(results[-1]))
+    return [hydrate_tweet(tweet) for tweet in results]
 
 ### Post a tweet
 @app.post(
@@ -343,7 +2473,7 @@ def home():
     summary="Post a tweet",
     tags=["Tweets"]
 )
-def post(tweet: Tweet = Body(...)): 
+def post(tweet: Tweet = Body(...), claims: dict = Depends(current_user)): 
     """
     Post a Tweet
 
@@ -359,18 +2489,107 @@ def post(tweet: Tweet = Body(...)):
         - created_at: datetime 
         - updated_at: Optional[datetime]
         - by: User
+        - media: List[UUID]
     """
-    results = read_data("tweets")
+    check_owner(claims, tweet.by.user_id)
     tweet_dict = tweet.dict()
     tweet_dict["tweet_id"] = str(tweet_dict["tweet_id"])
     tweet_dict["created_at"] = str(tweet_dict["created_at"])
-    tweet_dict["updated_at"] = str(tweet_dict["updated_at"])
-    tweet_dict["by"]["user_id"] = str(tweet_dict["by"]["user_id"])
-    tweet_dict["by"]["birth_date"] = str(tweet_dict["by"]["birth_date"])
+    tweet_dict["updated_at"] = optional_str(tweet_dict["updated_at"])
+    tweet_dict["by"] = user_cache.author(tweet_dict["by"]["user_id"])
+    tweet_dict["media"] = [str(media_id) for media_id in tweet_dict["media"]]
+    for media_id in tweet_dict["media"]:
+        if stores["media"].get(media_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"¡The media {media_id} doesn't exist!"
+            )
+
+    stores["tweets"].insert(tweet_dict)
+    return tweet_dict
+
+### Show many tweets
+@app.get(
+    path="/tweets:batch",
+    response_model=List[TweetBatchItem],
+    status_code=status.HTTP_200_OK,
+    summary="Show many tweets",
+    tags=["Tweets"]
+)
+def show_many_tweets(
+    ids: List[UUID] = Query(
+        ...,
+        title="Tweet IDs",
+        description=f"The tweets IDs, up to {BATCH_MAX_IDS}"
+    )
+):
+    """
+    Show many Tweets
+
+    This path operation shows many tweets in one request, in the same order
+    of the ids. The ids that don't exist are reported with found = false
+
+    Parameters:
+        - ids: List[UUID]
+
+    Returns a json list with one item per id:
+        - tweet_id: UUID
+        - found: bool
+        - tweet: Optional[Tweet]
+    """
+    return batch_data("tweets", ids, "tweet", hydrate_tweet)
+
+### Stream the tweets
+@app.get(
+    path="/tweets/stream",
+    status_code=status.HTTP_200_OK,
+    summary="Stream the tweets changes",
+    tags=["Tweets"]
+)
+async def stream_tweets(
+    request: Request,
+    last_event_id: Optional[str] = Header(default=None)
+):
+    """
+    Stream the Tweets
 
-    results.append(tweet_dict)
-    overwrite_data("tweets", results)
-    return tweet
+    This path operation sends the new, updated and deleted tweets as
+    server-sent events, so the clients don't need to poll all the tweets
+
+    Parameters:
+        - Last-Event-ID header: the id of the last event received, to resume
+
+    Returns a text/event-stream with the events:
+        - created: Tweet
+        - updated: Tweet
+        - deleted: tweet_id
+        - reset: the client must fetch all the tweets again
+    """
+    queue, replay, last_id = broadcaster.subscribe(last_event_id)
+
+    async def events():
+        try:
+            for message in replay:
+                yield message
+            while not await request.is_disconnected():
+                try:
+                    item = await asyncio.wait_for(queue.get(), STREAM_KEEP_ALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                id, message = item
+                if id > last_id:
+                    yield message
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 ### Show a tweet
 @app.get(
@@ -403,7 +2622,7 @@ def show_a_tweet(
         - updated_at: Optional[datetime]
         - by: User
     """
-    return show_data("tweets", tweet_id, "tweet")
+    return show_data_json("tweets", tweet_id, "tweet", Tweet, hydrate_tweet)
 
 ### Delete a tweet
 @app.delete(
@@ -419,7 +2638,8 @@ def delete_a_tweet(
         title="Tweet ID",
         description="This is the tweet ID",
         example="3fa85f64-5717-4562-b3fc-2c963f66afa9"
-    )
+    ),
+    claims: dict = Depends(current_user)
 ): 
     """
     Delete a Tweet
@@ -436,6 +2656,7 @@ def delete_a_tweet(
         - updated_at: Optional[datetime]
         - by: User
     """
+    check_owner(claims, show_data("tweets", tweet_id, "tweet")["by"]["user_id"])
     return delete_data("tweets", tweet_id, "tweet")
 
 ### Update a tweet
@@ -459,7 +2680,8 @@ def update_a_tweet(
         max_length=256,
         title="Tweet content",
         description="This is the content of the tweet",
-    )
+    ),
+    claims: dict = Depends(current_user)
 ): 
     """
     Update Tweet
@@ -477,17 +2699,581 @@ def update_a_tweet(
         - updated_at: datetime
         - by: user: User
     """
-    tweet_id = str(tweet_id)
-    results = read_data("tweets")
-    for tweet in results:
-        if tweet['tweet_id'] == tweet_id:
-            tweet['content'] = content
-            tweet['updated_at'] = str(datetime.now())
-            print(tweet)
-            overwrite_data("tweets", results)
-            return tweet
+    tweet = dict(show_data("tweets", tweet_id, "tweet"))
+    check_owner(claims, tweet["by"]["user_id"])
+    tweet['content'] = content
+    tweet['updated_at'] = str(datetime.now())
+    tweet['by'] = user_cache.author(tweet["by"]["user_id"])
+    return stores["tweets"].replace(tweet_id, tweet)
+
+### Patch a tweet
+@app.patch(
+    path="/tweets/{tweet_id}",
+    response_model=Tweet,
+    status_code=status.HTTP_200_OK,
+    summary="Patch a tweet",
+    tags=["Tweets"]
+)
+def patch_a_tweet(
+    response: Response,
+    tweet_id: UUID = Path(
+        ...,
+        title="Tweet ID",
+        description="This is the tweet ID",
+        example="3fa85f64-5717-4562-b3fc-2c963f66afa9"
+    ),
+    patch: Dict[str, Any] = Body(
+        ...,
+        media_type="application/merge-patch+json",
+        example={"content": "New content"}
+    ),
+    if_match: Optional[str] = Header(default=None),
+    claims: dict = Depends(current_user)
+):
+    """
+    Patch Tweet
+
+    This path operation change only the given fields of a tweet, with a
+    JSON merge patch. With an If-Match header the tweet is only changed
+    if its version (the ETag of GET /tweets/{tweet_id}) is still the same
+
+    Parameters:
+    - tweet_id: UUID
+    - Request body parameter:
+        - **patch: dict** -> The content and/or the media of the tweet
+    - If-Match header: the expected version
+
+    Returns a json with:
+        - tweet_id: UUID
+        - content: str
+        - created_at: datetime
+        - updated_at: datetime
+        - by: User
+        - media: List[UUID]
+    """
+    check_owner(claims, show_data("tweets", tweet_id, "tweet")["by"]["user_id"])
+    for media_id in patch.get("media") or []:
+        if stores["media"].get(media_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"¡The media {media_id} doesn't exist!"
+            )
+    tweet = patch_data(
+        "tweets", tweet_id, "tweet", Tweet, patch, if_match,
+        ["tweet_id", "created_at", "updated_at", "by"],
+        stamp={"updated_at": str(datetime.now())}
+    )
+    response.headers["ETag"] = f'"{version_of(tweet)}"'
+    return hydrate_tweet(tweet)
+
+## Media
+
+### Upload a media
+@app.post(
+    path="/media",
+    response_model=Media,
+    status_code=status.HTTP_201_CREATED,
+    summary="Upload a media",
+    tags=["Media"]
+)
+def upload_media(image: UploadFile = File(...)):
+    """
+    Upload a Media
+
+    This path operation upload an image to attach it in the tweets. The image
+    is stored once by its content, and the thumbnails are generated in a
+    process pool after the response. Only JPEG, PNG, GIF and WebP images up
+    to MEDIA_MAX_SIZE are accepted; the type is read from the image itself,
+    and an image Pillow can't read is rejected
+
+    Parameters:
+        - Request body parameter
+            - image: UploadFile
+
+    Returns a json with the media information:
+        - media_id: UUID
+        - filename: str
+        - content_type: str
+        - size: int
+        - sha256: str
+        - created_at: datetime
+        - variants: Dict[str, str]
+        - variants_error: Optional[str]
+    """
+    content = image.file.read(MEDIA_MAX_SIZE + 1)
+    if len(content) > MEDIA_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"¡The images can't be bigger than {MEDIA_MAX_SIZE // (1024 * 1024)} MB!"
+        )
+    content_type = detect_image_type(content)
+    if content_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="¡Only JPEG, PNG, GIF and WebP images can be uploaded!"
+        )
+    if not check_image(content):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="¡This image is broken!"
+        )
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    with media_lock:
+        for media_id in media_by_sha256.get(sha256):
+            media = stores["media"].get(media_id)
+            if media is not None:
+                return media
+
+        os.makedirs(MEDIA_DIR, exist_ok=True)
+        path = os.path.join(MEDIA_DIR, sha256)
+        with open(path, "wb") as f:
+            f.write(content)
+        media_dict = {
+            "media_id": str(uuid4()),
+            "filename": image.filename,
+            "content_type": content_type,
+            "size": len(content),
+            "sha256": sha256,
+            "created_at": str(datetime.now()),
+            "variants": {}
+        }
+        stores["media"].insert(media_dict)
+
+    if Image is not None:
+        future = get_process_pool().submit(make_variants, path, sha256)
+        future.add_done_callback(partial(save_variants, media_dict["media_id"]))
+    return media_dict
+
+### Show a media
+@app.get(
+    path="/media/{media_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Show a media",
+    tags=["Media"]
+)
+def show_a_media(
+    media_id: UUID = Path(
+        ...,
+        title="Media ID",
+        description="This is the media ID",
+        example="3fa85f64-5717-4562-b3fc-2c963f66afa7"
+    ),
+    variant: Optional[str] = None,
+    range: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Show a Media
+
+    This path operation send the original image or one of its variants
+
+    Parameters:
+        - media_id: UUID
+        - variant: Optional[str] -> thumb, small or medium
+        - Range and If-None-Match headers
+
+    Returns the image bytes with cache headers
+    """
+    media = show_data("media", media_id, "media")
+    if variant is None:
+        return send_file(
+            os.path.join(MEDIA_DIR, media["sha256"]),
+            media["content_type"],
+            media["sha256"],
+            range,
+            if_none_match
+        )
+    if variant not in MEDIA_VARIANTS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="¡This variant doesn't exist!"
+        )
+    if variant not in media["variants"] and media.get("variants_error"):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="¡The variants of this image couldn't be made!"
+        )
+    if variant not in media["variants"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="¡This variant is not ready yet!"
+        )
+    return send_file(
+        os.path.join(MEDIA_DIR, media["variants"][variant]),
+        "image/jpeg",
+        f"{media['sha256']}_{variant}",
+        range,
+        if_none_match
+    )
+
+data_lock = None
+
+def lock_data_dir():
+    """
+    Takes an exclusive lock of the data dir for this process, so a second
+    worker (uvicorn --workers N) or app fails on startup instead of
+    overwriting the writes of the first one
+    """
+    global data_lock
+    if fcntl is None or data_lock is not None:
+        return
+    lock = open(DATA_LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        raise RuntimeError(
+            f"Another process is serving the json files of this dir ({DATA_LOCK_FILE} "
+            "is locked). The app must run in a single worker process."
+        )
+    data_lock = lock
+
+def unlock_data_dir():
+    global data_lock
+    if data_lock is not None:
+        data_lock.close()
+        data_lock = None
+
+def watch_exit_signals():
+    """
+    uvicorn waits for the open connections to close before the shutdown of
+    the lifespan, and a stream never ends by itself. So on SIGINT/SIGTERM
+    the streams are closed first, and then the signal goes on to uvicorn.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for exit_signal in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(exit_signal)
+
+        def handler(signum, frame, previous=previous):
+            draining.set()
+            loop.call_soon_threadsafe(broadcaster.close)
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(exit_signal, handler)
+
+def start_up():
+    """
+    Repairs the files left broken by a crash before any store reads them
+    and starts the compaction
+    """
+    lock_data_dir()
+    watch_exit_signals()
+    for file, store in stores.items():
+        for repair in recover_data(file):
+            logger.warning("Recovery: %s", repair)
+        store.open()
+    draining.clear()
+    compaction_stop.clear()
+    threading.Thread(target=compact_stores, name="compaction", daemon=True).start()
+
+async def shut_down():
+    """
+    Stops taking requests, waits up to SHUTDOWN_TIMEOUT for the ones in
+    flight, and writes with fsync the changes the stores haven't saved yet
+    """
+    draining.set()
+    broadcaster.close()
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    while in_flight and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    compaction_stop.set()
+    global process_pool
+    if process_pool is not None:
+        # Before closing the stores: the thumbnails still being made save
+        # their variants in the media store when they are done
+        await run_in_threadpool(process_pool.shutdown, wait=True)
+        process_pool = None
+    for store in stores.values():
+        await run_in_threadpool(store.close)
+    unlock_data_dir()
+
+## Internal
+
+### Ingest users and tweets
+@app.post(
+    path="/internal/ingest",
+    status_code=status.HTTP_200_OK,
+    summary="Ingest users and tweets",
+    tags=["Internal"]
+)
+async def ingest(
+    request: Request,
+    x_ingest_token: Optional[str] = Header(default=None)
+):
+    """
+    Ingest
+
+    This path operation bulk load users and tweets for the trusted internal
+    pipelines. The records are checked with a lightweight validator instead
+    of the Pydantic models (the big batches in the process pool) and saved
+    with one write per file. The authors and media of the tweets aren't checked
+
+    Parameters:
+    - Request body: NDJSON, one {"type": "user" | "tweet", ...record} per line
+    - X-Ingest-Token header: the INGEST_TOKEN of the app
+
+    Returns a json with:
+        - users: int -> users inserted
+        - tweets: int -> tweets inserted
+        - errors: list of {line, error}
+    """
+    if INGEST_TOKEN is None or x_ingest_token is None or not hmac.compare_digest(
+        x_ingest_token, INGEST_TOKEN
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="¡The ingest is only for the internal pipelines!"
+        )
+    lines = (await request.body()).decode("utf-8").splitlines()
+
+    if len(lines) < INGEST_PARALLEL_LINES:
+        records, errors = await run_in_threadpool(validate_lines, lines)
     else:
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*[
+            loop.run_in_executor(
+                get_process_pool(), validate_lines,
+                lines[start:start + INGEST_CHUNK_LINES], start + 1
+            )
+            for start in range(0, len(lines), INGEST_CHUNK_LINES)
+        ])
+        records = {"users": [], "tweets": []}
+        errors = []
+        for chunk_records, chunk_errors in chunks:
+            records["users"].extend(chunk_records["users"])
+            records["tweets"].extend(chunk_records["tweets"])
+            errors.extend(chunk_errors)
+
+    inserted = {}
+    for file, batch in records.items():
+        numbers = [data.pop("_line") for data in batch]
+        duplicated = await run_in_threadpool(stores[file].insert_many, batch)
+        inserted[file] = len(batch) - len(duplicated)
+        errors.extend(
+            {"line": numbers[position], "error": "The id already exist"}
+            for position in duplicated
+        )
+    errors.sort(key=lambda error: error["line"])
+    return {"users": inserted["users"], "tweets": inserted["tweets"], "errors": errors}
+
+## Stats
+
+### Show the stats of the app
+@app.get(
+    path="/stats",
+    response_model=AppStats,
+    status_code=status.HTTP_200_OK,
+    summary="Show the stats of the app",
+    tags=["Stats"]
+)
+def show_stats():
+    """
+    Show the Stats
+
+    This path operation shows the totals of the app, from counters that
+    are updated on every signup, post, update and delete
+
+    Parameters:
+        -
+
+    Returns a json with:
+        - users: int
+        - tweets: int
+        - last_posted_at: Optional[datetime]
+    """
+    return stats.totals()
+
+## Admin
+
+### Show the profiles
+@app.get(
+    path="/admin/profiles",
+    response_model=List[ProfileOut],
+    status_code=status.HTTP_200_OK,
+    summary="Show the recent profiles",
+    tags=["Admin"]
+)
+def show_profiles(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Show the Profiles
+
+    This path operation shows the recent request profiles, newest first.
+    The profiling is only on when the app runs with PROFILING=1
+
+    Parameters:
+    - X-Admin-Token header: the ADMIN_TOKEN of the app
+
+    Returns a json list with:
+        - request_id: str
+        - method: str
+        - path: str
+        - status_code: int
+        - duration_ms: float
+        - created_at: datetime
+    """
+    check_admin_token(x_admin_token)
+    with profiles_lock:
+        return list(reversed(profiles.values()))
+
+### Export a snapshot
+@app.get(
+    path="/admin/snapshot",
+    status_code=status.HTTP_200_OK,
+    summary="Export a snapshot",
+    tags=["Admin"]
+)
+def export_snapshot(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Export a Snapshot
+
+    This path operation download a backup of the users, tweets and media
+    as they were at the same point in time, without stopping the writes.
+    The image files of the media aren't included
+
+    Parameters:
+    - X-Admin-Token header: the ADMIN_TOKEN of the app
+
+    Returns a gzip NDJSON file: a header line with the counts, then a line per record
+    """
+    check_admin_token(x_admin_token)
+    snapshot = take_snapshot()
+    return StreamingResponse(
+        iter_snapshot(snapshot),
+        media_type="application/gzip",
+        headers={
+            "Content-Disposition": f'attachment; filename="snapshot-{datetime.now():%Y%m%d%H%M%S}.ndjson.gz"'
+        }
+    )
+
+### Restore a snapshot
+@app.post(
+    path="/admin/snapshot",
+    status_code=status.HTTP_200_OK,
+    summary="Restore a snapshot",
+    tags=["Admin"]
+)
+async def restore_a_snapshot(
+    request: Request,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Restore a Snapshot
+
+    This path operation replace all the users, tweets and media with the
+    ones of a snapshot from GET /admin/snapshot. The snapshot is read as it
+    is uploaded and checked completely first; then each file is written
+    once, without the validation and the writes of each signup and post
+
+    Parameters:
+    - Request body: the gzip NDJSON snapshot
+    - X-Admin-Token header: the ADMIN_TOKEN of the app
+
+    Returns a json with the users, tweets and media restored
+    """
+    check_admin_token(x_admin_token)
+    reader = SnapshotReader()
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(reader.feed, chunk)
+        records = reader.close()
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"¡{error}!"
+        )
+    return await run_in_threadpool(restore_snapshot, records)
+
+### Download a profile
+@app.get(
+    path="/admin/profiles/{request_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Download a profile",
+    tags=["Admin"]
+)
+def download_profile(
+    request_id: str = Path(
+        ...,
+        title="Request ID",
+        description="This is the X-Profile-ID of the profiled response"
+    ),
+    format: str = Query(
+        default="prof",
+        regex="^(prof|text)$",
+        description="prof for pstats/snakeviz, text for a summary"
+    ),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Download a Profile
+
+    This path operation download the profile of a request
+
+    Parameters:
+        - request_id: str
+        - format: str -> prof or text
+        - X-Admin-Token header: the ADMIN_TOKEN of the app
+
+    Returns the pstats file, or the 50 most expensive calls as text
+    """
+    check_admin_token(x_admin_token)
+    with profiles_lock:
+        profile = profiles.get(request_id)
+    if profile is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="This tweet doesn't exist!"
-        )
\ No newline at end of file
+            detail="¡This profile doesn't exist!"
+        )
+    if format == "text":
+        output = StringIO()
+        stats = pstats.Stats(stream=output)
+        stats.add(profile["stats"])
+        stats.sort_stats("cumulative").print_stats(50)
+        return PlainTextResponse(output.getvalue())
+    return Response(
+        content=marshal.dumps(profile["stats"].stats),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{request_id}.prof"'}
+    )
+
+## Metrics
+
+### Show the metrics
+@app.get(
+    path="/metrics",
+    status_code=status.HTTP_200_OK,
+    summary="Show the metrics",
+    tags=["Metrics"]
+)
+def show_metrics():
+    """
+    Show the Metrics
+
+    This path operation shows the counters of the app internals
+
+    Parameters:
+        -
+
+    Returns a json with:
+        - single_flight: requests, executions and coalesced requests of the hot reads
+        - tombstones: deleted records waiting for the compaction, per file
+        - stream: subscribers, published events and dropped slow subscribers
+        - user_cache: size, hits, misses, evictions and invalidations of the users cache
+    """
+    return {
+        "single_flight": dict(single_flight.metrics),
+        "user_cache": {
+            "size": len(user_cache.entries),
+            **user_cache.metrics
+        },
+        "stream": {
+            "subscribers": len(broadcaster.subscribers),
+            **broadcaster.metrics
+        },
+        "tombstones": {
+            file: len(store.tombstones) for file, store in stores.items()
+        }
+    }
@@ -0,0 +1,309 @@
+# Python
+import os
+import re
+import sys
+import json
+import argparse
+from uuid import UUID
+from datetime import date
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# App
+from main2 import compile_schema, is_uuid, is_datetime, USER_FIELDS
+
+# Offline migration of users.json, tweets.json and media.json
+#
+#   python migrate.py --input-dir . --output-dir migrated
+#
+# The files are read as a stream and normalized in parallel chunks, so the
+# memory only grows with the ids (to find the duplicates) and with the
+# public user data (to fill the `by` of the tweets), not with the files.
+#
+# A file with invalid records isn't written, unless --drop-invalid is given.
+
+FILES = ("users", "media", "tweets")
+SEPARATORS = re.compile(r"[\s,]*")
+
+# The users saved before the password rules keep their short passwords
+validate_user_record = compile_schema({
+    **USER_FIELDS,
+    "password": (True, lambda password: isinstance(password, str) and len(password) > 0)
+})
+validate_tweet_fields = compile_schema({
+    "tweet_id": (True, is_uuid),
+    "content": (True, lambda content: isinstance(content, str) and 1 <= len(content) <= 256),
+    "created_at": (True, is_datetime),
+    "updated_at": (False, is_datetime),
+    "by": (True, lambda by: isinstance(by, dict) and is_uuid(by.get("user_id"))),
+    "media": (False, lambda media: isinstance(media, list) and all(map(is_uuid, media)))
+})
+validate_media = compile_schema({
+    "media_id": (True, is_uuid),
+    "sha256": (True, lambda sha256: isinstance(sha256, str) and len(sha256) == 64),
+    "content_type": (True, lambda content_type: isinstance(content_type, str))
+})
+
+# Reading and writing
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """
+    Yields the items of a json array file reading chunk_size characters at a
+    time, so a multi-GB file never is in memory at once
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        position = SEPARATORS.match(buffer).end()
+        if buffer[position:position + 1] != "[":
+            raise ValueError(f"{path} is not a json array")
+        position += 1
+        eof = False
+        while True:
+            position = SEPARATORS.match(buffer, position).end()
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("Need more data", buffer, position)
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield item
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def bounded_map(pool, function, chunks, window):
+    """
+    Like pool.map, but with at most `window` chunks in flight, so the
+    reader never gets ahead of the workers and fills the memory
+    """
+    pending = []
+    for chunk in chunks:
+        pending.append(pool.submit(function, chunk))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+class ArrayWriter:
+    """
+    Writes a compact json array (the format of overwrite_data) item by item
+    to a temporary file, moved over the final one when it is complete
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(f"{path}.tmp", "w", encoding="utf-8")
+        self.file.write("[")
+        self.count = 0
+
+    def write(self, item):
+        if self.count:
+            self.file.write(", ")
+        self.file.write(json.dumps(item))
+        self.count += 1
+
+    def close(self):
+        self.file.write("]")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(f"{self.path}.tmp")
+
+# Normalization (runs in the workers)
+
+def normalize_id(value):
+    try:
+        return str(UUID(str(value)))
+    except ValueError:
+        return value
+
+def normalize_date(value):
+    if value in (None, "", "None"):
+        return None
+    try:
+        return str(date.fromisoformat(str(value)[:10]))
+    except ValueError:
+        return value
+
+def normalize_datetime(value):
+    if value in (None, "", "None"):
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).isoformat(sep=" ")
+    except ValueError:
+        return value
+
+def normalize_user(user):
+    user = dict(user)
+    user["user_id"] = normalize_id(user.get("user_id"))
+    user["birth_date"] = normalize_date(user.get("birth_date"))
+    return user, validate_user_record(user)
+
+def normalize_tweet(tweet):
+    tweet = dict(tweet)
+    tweet["tweet_id"] = normalize_id(tweet.get("tweet_id"))
+    tweet["created_at"] = normalize_datetime(tweet.get("created_at"))
+    tweet["updated_at"] = normalize_datetime(tweet.get("updated_at"))
+    tweet["media"] = [normalize_id(media_id) for media_id in tweet.get("media") or []]
+    if isinstance(tweet.get("by"), dict):
+        tweet["by"] = {**tweet["by"], "user_id": normalize_id(tweet["by"].get("user_id"))}
+    return tweet, validate_tweet_fields(tweet)
+
+def normalize_media(media):
+    media = dict(media)
+    media["media_id"] = normalize_id(media.get("media_id"))
+    media.setdefault("variants", {})
+    return media, validate_media(media)
+
+NORMALIZERS = {
+    "users": normalize_user,
+    "tweets": normalize_tweet,
+    "media": normalize_media
+}
+
+def normalize_chunk(file_and_chunk):
+    file, chunk = file_and_chunk
+    return [NORMALIZERS[file](item) for item in chunk]
+
+# Migration
+
+class ErrorLog:
+    """
+    Counts the errors, keeps the first ones for the summary and writes all
+    of them to the NDJSON file, if any, instead of keeping them in memory
+    """
+
+    def __init__(self, path, keep=20):
+        self.file = open(path, "w", encoding="utf-8") if path else None
+        self.keep = keep
+        self.first = []
+        self.count = 0
+
+    def add(self, file, id, error):
+        error = {"file": file, "id": id, "error": error}
+        self.count += 1
+        if len(self.first) < self.keep:
+            self.first.append(error)
+        if self.file is not None:
+            self.file.write(json.dumps(error) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+def read_tombstones(input_dir, file):
+    try:
+        with open(os.path.join(input_dir, f"{file}.deleted"), "r", encoding="utf-8") as f:
+            return {normalize_id(line.strip()) for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+def migrate_file(file, args, pool, authors, report, errors):
+    """
+    Normalizes, validates and deduplicates one file. The users are kept in
+    `authors` (without password) to fill the `by` of the tweets. If a
+    record is invalid the file is only written with --drop-invalid.
+    """
+    path = os.path.join(args.input_dir, f"{file}.json")
+    if not os.path.exists(path):
+        return
+    info = "user" if file == "users" else "tweet" if file == "tweets" else "media"
+    key = f"{info}_id"
+    deleted = read_tombstones(args.input_dir, file)
+    seen = set()
+    counts = report[file] = {"read": 0, "written": 0, "duplicated": 0, "deleted": 0, "invalid": 0}
+    writer = ArrayWriter(os.path.join(args.output_dir, f"{file}.json"))
+
+    chunks = ((file, chunk) for chunk in iter_chunks(iter_json_array(path), args.chunk_size))
+    for results in bounded_map(pool, normalize_chunk, chunks, args.workers * 2):
+        for record, error in results:
+            counts["read"] += 1
+            id = record.get(key)
+            if id in deleted:
+                counts["deleted"] += 1
+                continue
+            if error is None and file == "tweets":
+                author = authors.get(record["by"]["user_id"])
+                if author is None:
+                    error = "The author doesn't exist"
+                else:
+                    record["by"] = author
+            if error is not None:
+                counts["invalid"] += 1
+                errors.add(file, id, error)
+                continue
+            if id in seen:
+                counts["duplicated"] += 1
+                errors.add(file, id, "Duplicated id")
+                continue
+            seen.add(id)
+            record.setdefault("version", 1)
+            if file == "users":
+                authors[id] = {
+                    name: record.get(name) for name in USER_FIELDS
+                }
+            writer.write(record)
+            counts["written"] += 1
+    if counts["invalid"] and not args.drop_invalid:
+        writer.abort()
+        counts["written"] = 0
+        errors.add(file, None, "Not written, it has invalid records (see --drop-invalid)")
+    else:
+        writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize and compact the json files of the app")
+    parser.add_argument("--input-dir", default=".")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--errors", help="write every error to this NDJSON file")
+    parser.add_argument(
+        "--drop-invalid",
+        action="store_true",
+        help="write the files without their invalid records, instead of not writing them"
+    )
+    args = parser.parse_args()
+
+    if os.path.abspath(args.input_dir) == os.path.abspath(args.output_dir):
+        parser.error("The output dir must be another dir")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    report = {}
+    authors = {}
+    errors = ErrorLog(args.errors)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for file in FILES:
+            migrate_file(file, args, pool, authors, report, errors)
+    errors.close()
+
+    for file, counts in report.items():
+        print(f"{file}: " + ", ".join(f"{name} {count}" for name, count in counts.items()), file=sys.stderr)
+    for error in errors.first:
+        print(f"  {error['file']} {error['id']}: {error['error']}", file=sys.stderr)
+    if errors.count > len(errors.first):
+        print(f"  ... and {errors.count - len(errors.first)} more errors", file=sys.stderr)
+    return 1 if errors.count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# Python
+import os
+import sys
+import json
+import argparse
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+# Backup and restore of a running app with the snapshot endpoints
+#
+#   ADMIN_TOKEN=... python snapshot.py export --output backup.ndjson.gz
+#   ADMIN_TOKEN=... python snapshot.py restore --input backup.ndjson.gz
+#
+# The snapshot is streamed in both directions, so it is never in the
+# memory of this script.
+
+CHUNK_SIZE = 1 << 16
+
+def export(args):
+    request = Request(
+        f"{args.url}/admin/snapshot",
+        headers={"X-Admin-Token": args.token}
+    )
+    size = 0
+    with urlopen(request) as response, open(f"{args.output}.tmp", "wb") as f:
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+            size += len(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{args.output}.tmp", args.output)
+    print(f"{args.output}: {size} bytes", file=sys.stderr)
+
+def restore(args):
+    with open(args.input, "rb") as f:
+        request = Request(
+            f"{args.url}/admin/snapshot",
+            data=f,
+            method="POST",
+            headers={
+                "X-Admin-Token": args.token,
+                "Content-Type": "application/gzip",
+                "Content-Length": str(os.fstat(f.fileno()).st_size)
+            }
+        )
+        with urlopen(request) as response:
+            counts = json.load(response)
+    print(", ".join(f"{file} {count}" for file, count in counts.items()), file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or restore a snapshot of the app")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default=os.environ.get("ADMIN_TOKEN"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="download a snapshot")
+    export_parser.add_argument("--output", required=True)
+    restore_parser = commands.add_parser("restore", help="replace the data with a snapshot")
+    restore_parser.add_argument("--input", required=True)
+    args = parser.parse_args()
+
+    if not args.token:
+        parser.error("The ADMIN_TOKEN is required (--token or the environment)")
+    args.url = args.url.rstrip("/")
+    try:
+        if args.command == "export":
+            export(args)
+        else:
+            restore(args)
+    except HTTPError as error:
+        print(f"{error.code}: {error.read().decode('utf-8', 'replace')}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
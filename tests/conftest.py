@@ -0,0 +1,30 @@
+# Python
+import os
+import sys
+import shutil
+
+# Pytest
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    """
+    A copy of the app and its json files, so the tests never touch the real data
+    """
+    for name in os.listdir(ROOT):
+        if name.endswith(".py") or name.endswith(".json"):
+            shutil.copy(os.path.join(ROOT, name), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    main2 = sys.modules.get("main2")
+    if main2 is not None:
+        # The stores of an earlier test hold the records of its own copy
+        for store in main2.stores.values():
+            store.index = None
+            store.tombstones = set()
+            store.open()
+            for reset in store.resets:
+                reset()
+    return tmp_path
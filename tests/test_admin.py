@@ -0,0 +1,49 @@
+# Python
+import importlib
+
+# Pytest
+import pytest
+
+ADMIN_TOKEN = "admin-token"
+
+@pytest.fixture
+def profiling_app(app_dir, monkeypatch):
+    monkeypatch.setenv("PROFILING", "1")
+    monkeypatch.setenv("ADMIN_TOKEN", ADMIN_TOKEN)
+    import main2
+    # PROFILING and ADMIN_TOKEN are read when the module is loaded
+    main2 = importlib.reload(main2)
+    yield main2
+    monkeypatch.delenv("PROFILING")
+    monkeypatch.delenv("ADMIN_TOKEN")
+    importlib.reload(main2)
+
+def test_profiles_need_the_admin_token(profiling_app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(profiling_app.app) as client:
+        assert client.get("/admin/profiles").status_code == 403
+        assert client.get("/admin/profiles/abc").status_code == 403
+
+        assert "X-Profile-ID" not in client.get("/stats", headers={"X-Profile": "1"}).headers
+        response = client.get("/stats", headers={"X-Profile": "1", "X-Admin-Token": ADMIN_TOKEN})
+        request_id = response.headers["X-Profile-ID"]
+
+        response = client.get(f"/admin/profiles/{request_id}", headers={"X-Admin-Token": ADMIN_TOKEN})
+        assert response.status_code == 200
+
+def test_a_request_isnt_profiled_while_another_one_is(profiling_app):
+    from fastapi.testclient import TestClient
+
+    headers = {"X-Profile": "1", "X-Admin-Token": ADMIN_TOKEN}
+    with TestClient(profiling_app.app) as client:
+        # As if a slow profiled request were still running
+        with profiling_app.profiling_lock:
+            response = client.get("/stats", headers=headers)
+        assert response.status_code == 200
+        assert "X-Profile-ID" not in response.headers
+        assert "X-Profile-Skipped" in response.headers
+
+        response = client.get("/stats", headers=headers)
+        assert "X-Profile-ID" in response.headers
+        assert len(client.get("/admin/profiles", headers=headers).json()) == 1
@@ -0,0 +1,128 @@
+# Python
+import json
+from uuid import uuid4
+
+# Pytest
+import pytest
+
+from test_durability import new_user
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    with TestClient(main2.app) as client:
+        yield client
+
+def signup(client):
+    user = new_user()
+    assert client.post("/singup", json=user).status_code == 201
+    return user
+
+def login(client, user):
+    response = client.post("/login", data={"email": user["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def new_tweet(user):
+    by = {key: user[key] for key in ("user_id", "email", "first_name", "last_name")}
+    return {"tweet_id": str(uuid4()), "content": "Hello", "by": by}
+
+def can_post(client, user, headers):
+    return client.post("/post", json=new_tweet(user), headers=headers).status_code == 201
+
+def test_an_expired_token_is_rejected(client, monkeypatch):
+    import main2
+
+    user = signup(client)
+    monkeypatch.setattr(main2, "TOKEN_TTL", -1)
+    headers = login(client, user)
+
+    response = client.post("/post", json=new_tweet(user), headers=headers)
+
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+def test_a_tampered_token_is_rejected(client):
+    from main2 import b64decode, b64encode
+
+    user, other = signup(client), signup(client)
+    payload, signature = login(client, user)["Authorization"][len("Bearer "):].split(".")
+    claims = json.loads(b64decode(payload))
+    claims["sub"] = other["user_id"]
+    forged = b64encode(json.dumps(claims).encode("utf-8"))
+    flipped = signature[:-1] + ("A" if signature[-1] != "A" else "B")
+
+    for token in (f"{forged}.{signature}", f"{payload}.{flipped}", payload, "a.b.c"):
+        assert not can_post(client, other, {"Authorization": f"Bearer {token}"})
+        assert not can_post(client, user, {"Authorization": f"Bearer {token}"})
+
+def test_logout_revokes_only_its_token(client):
+    user = signup(client)
+    headers, other_headers = login(client, user), login(client, user)
+
+    assert client.post("/logout", headers=headers).status_code == 200
+
+    assert client.post("/post", json=new_tweet(user), headers=headers).status_code == 401
+    assert client.post("/logout", headers=headers).status_code == 401
+    assert can_post(client, user, other_headers)
+
+@pytest.mark.parametrize("change", ["put", "patch"])
+def test_a_new_password_revokes_the_old_tokens(client, change):
+    user = signup(client)
+    headers = login(client, user)
+    changed = {**user, "password": "87654321"}
+
+    if change == "put":
+        response = client.put(f"/users/{user['user_id']}/update", json=changed, headers=headers)
+    else:
+        response = client.patch(
+            f"/users/{user['user_id']}",
+            content=json.dumps({"password": changed["password"]}),
+            headers={**headers, "Content-Type": "application/merge-patch+json"}
+        )
+    assert response.status_code == 200
+
+    assert not can_post(client, user, headers)
+    assert can_post(client, user, login(client, changed))
+
+def test_other_changes_keep_the_tokens(client):
+    user = signup(client)
+    headers = login(client, user)
+
+    response = client.put(
+        f"/users/{user['user_id']}/update",
+        json={**user, "first_name": "Juan"},
+        headers=headers
+    )
+
+    assert response.status_code == 200
+    assert can_post(client, user, headers)
+
+def test_deleting_a_user_revokes_its_tokens(client):
+    user = signup(client)
+    headers, other_headers = login(client, user), login(client, user)
+
+    assert client.delete(f"/users/{user['user_id']}/delete", headers=headers).status_code == 200
+
+    assert client.post("/logout", headers=other_headers).status_code == 401
+
+def test_the_tweets_need_the_token_of_their_author(client):
+    user, other = signup(client), signup(client)
+    headers, other_headers = login(client, user), login(client, other)
+    tweet = new_tweet(user)
+    path = f"/tweets/{tweet['tweet_id']}"
+
+    assert client.post("/post", json=tweet).status_code == 401
+    assert client.post("/post", json=tweet, headers=other_headers).status_code == 403
+    assert client.post("/post", json=tweet, headers=headers).status_code == 201
+
+    changed = {"content": "Bye"}
+    assert client.put(f"{path}/update", data=changed).status_code == 401
+    assert client.put(f"{path}/update", data=changed, headers=other_headers).status_code == 403
+    assert client.delete(f"{path}/delete").status_code == 401
+    assert client.delete(f"{path}/delete", headers=other_headers).status_code == 403
+
+    assert client.get(path).json()["content"] == "Hello"
+    assert client.put(f"{path}/update", data=changed, headers=headers).status_code == 200
+    assert client.delete(f"{path}/delete", headers=headers).status_code == 200
@@ -0,0 +1,62 @@
+# Python
+from uuid import uuid4
+
+# Pytest
+import pytest
+
+# Records of the repo's own data
+LEGACY_USER_ID = "3fa85f64-5717-4562-b3fc-2c963f66afa6"
+LEGACY_TWEET_ID = "5fa75f64-5717-4562-b3fc-2c963f66afa6"
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    with TestClient(main2.app) as client:
+        yield client
+
+def test_many_users_come_in_the_order_of_the_ids(client):
+    missing = str(uuid4())
+
+    response = client.get("/users:batch", params={"ids": [missing, LEGACY_USER_ID, missing]})
+
+    assert response.status_code == 200
+    items = response.json()
+    assert [item["user_id"] for item in items] == [missing, LEGACY_USER_ID, missing]
+    assert [item["found"] for item in items] == [False, True, False]
+    assert items[0]["user"] is None
+    assert items[1]["user"]["email"] == "user@example.com"
+    assert "password" not in items[1]["user"]
+
+def test_many_tweets_have_their_author_up_to_date(client):
+    import main2
+
+    users = main2.stores["users"]
+    users.replace(LEGACY_USER_ID, {**users.get(LEGACY_USER_ID), "first_name": "Renamed"})
+    missing = str(uuid4())
+
+    response = client.get("/tweets:batch", params={"ids": [LEGACY_TWEET_ID, missing]})
+
+    assert response.status_code == 200
+    found, not_found = response.json()
+    assert found["found"] and found["tweet"]["tweet_id"] == LEGACY_TWEET_ID
+    assert found["tweet"]["by"]["first_name"] == "Renamed"
+    assert not_found == {"tweet_id": missing, "found": False, "tweet": None}
+
+@pytest.mark.parametrize("path", ["/users:batch", "/tweets:batch"])
+def test_too_many_ids_are_rejected(client, path):
+    import main2
+
+    ids = [str(uuid4()) for _ in range(main2.BATCH_MAX_IDS + 1)]
+
+    response = client.get(path, params={"ids": ids})
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == f"¡Only {main2.BATCH_MAX_IDS} ids can be requested at once!"
+    assert client.get(path, params={"ids": ids[:-1]}).status_code == 200
+
+@pytest.mark.parametrize("path", ["/users:batch", "/tweets:batch"])
+def test_the_ids_must_be_uuids(client, path):
+    assert client.get(path, params={"ids": ["abc"]}).status_code == 422
+    assert client.get(path).status_code == 422
@@ -0,0 +1,28 @@
+# Pytest
+import pytest
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi import FastAPI
+    from fastapi.responses import Response
+    from fastapi.testclient import TestClient
+    import main2
+
+    app = FastAPI()
+    app.middleware("http")(main2.compress_responses)
+    bodies = {"body": b"a" * 4096}
+
+    @app.get("/record")
+    def record():
+        return Response(content=bodies["body"], media_type="application/json", headers={"ETag": '"1"'})
+
+    with TestClient(app) as client:
+        yield client, bodies
+
+def test_a_repeated_etag_with_another_body_isnt_served_from_the_cache(client):
+    client, bodies = client
+    headers = {"Accept-Encoding": "gzip"}
+    assert client.get("/record", headers=headers).content == b"a" * 4096
+
+    bodies["body"] = b"b" * 4096
+    assert client.get("/record", headers=headers).content == b"b" * 4096
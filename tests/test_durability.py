@@ -0,0 +1,180 @@
+# Python
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import threading
+import subprocess
+from uuid import uuid4
+from urllib.error import URLError, HTTPError
+from urllib.request import Request, urlopen
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(app_dir, port):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main2:app", "--port", str(port)],
+        cwd=app_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1).read()
+            return server
+        except (URLError, ConnectionError):
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The server didn't start")
+
+def new_user():
+    return {
+        "user_id": str(uuid4()),
+        "email": f"{uuid4().hex[:12]}@example.com",
+        "first_name": "Santiago",
+        "last_name": "Tellez",
+        "birth_date": "1990-05-17",
+        "password": "12345678"
+    }
+
+def signup(port, user):
+    request = Request(
+        f"http://127.0.0.1:{port}/singup",
+        data=json.dumps(user).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with urlopen(request, timeout=10) as response:
+        return response.status
+
+def test_acknowledged_signups_survive_a_kill_mid_write(app_dir):
+    port = free_port()
+    server = start_server(app_dir, port)
+    acknowledged = []
+    stop = threading.Event()
+
+    def load():
+        while not stop.is_set():
+            user = new_user()
+            try:
+                if signup(port, user) == 201:
+                    acknowledged.append(user["user_id"])
+            except (URLError, HTTPError, ConnectionError, OSError):
+                return
+
+    workers = [threading.Thread(target=load) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    time.sleep(1.5)
+    server.send_signal(signal.SIGKILL)
+    server.wait()
+    stop.set()
+    for worker in workers:
+        worker.join()
+    assert acknowledged
+
+    server = start_server(app_dir, port)
+    try:
+        with open(os.path.join(app_dir, "users.json"), encoding="utf-8") as f:
+            saved = {user["user_id"] for user in json.load(f)}
+        assert set(acknowledged) <= saved
+        for user_id in acknowledged[-20:]:
+            with urlopen(f"http://127.0.0.1:{port}/users/{user_id}", timeout=10) as response:
+                assert response.status == 200
+        assert not [name for name in os.listdir(app_dir) if name.endswith(".tmp")]
+    finally:
+        server.terminate()
+        server.wait()
+
+def test_recover_data_keeps_the_records_of_a_torn_file(app_dir):
+    from main2 import recover_data
+
+    users = [new_user() for _ in range(3)]
+    text = json.dumps(users)
+    with open("users.json", "w", encoding="utf-8") as f:
+        f.write(text[:-20])
+    with open("users.json.tmp", "w", encoding="utf-8") as f:
+        f.write("[{")
+
+    repairs = recover_data("users")
+
+    assert len(repairs) == 2
+    with open("users.json", encoding="utf-8") as f:
+        assert json.load(f) == users[:2]
+    assert not os.path.exists("users.json.tmp")
+
+def test_stores_save_again_after_a_restart_of_the_app(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    statuses = []
+    for _ in range(2):
+        with TestClient(main2.app) as client:
+            worker = threading.Thread(
+                target=lambda: statuses.append(client.post("/singup", json=new_user()).status_code)
+            )
+            worker.start()
+            worker.join(timeout=10)
+            assert not worker.is_alive(), "The signup hung after a restart"
+    assert statuses == [201, 201]
+    assert main2.process_pool is None
+
+def test_tombstones_of_purged_records_dont_hide_new_ones(app_dir):
+    from main2 import Store
+
+    # A crash after the compaction wrote the json but before the tombstones
+    user = new_user()
+    with open("users.json", "w", encoding="utf-8") as f:
+        json.dump([], f)
+    with open("users.deleted", "w", encoding="utf-8") as f:
+        f.write(f"{user['user_id']}\n")
+
+    store = Store("users", "user")
+    assert store.count() == 0
+    store.insert(user)
+
+    assert store.get(user["user_id"]) == user
+    assert store.count() == 1
+    store.close()
+
+def test_a_second_process_cant_serve_the_same_files(app_dir):
+    port = free_port()
+    server = start_server(app_dir, port)
+    try:
+        second = subprocess.run(
+            [sys.executable, "-m", "uvicorn", "main2:app", "--port", str(free_port())],
+            cwd=app_dir,
+            capture_output=True,
+            text=True,
+            timeout=30
+        )
+        assert second.returncode != 0
+        assert "single worker" in second.stderr
+    finally:
+        server.terminate()
+        server.wait()
+
+def test_a_deleted_id_can_be_inserted_again_right_away(app_dir):
+    from main2 import Store
+
+    store = Store("users", "user")
+    old, new = new_user(), new_user()
+    new["user_id"] = old["user_id"]
+    store.insert(old)
+    store.remove(old["user_id"])
+
+    store.insert(new)
+
+    assert store.get(new["user_id"])["email"] == new["email"]
+    store.close()
+    # The disk has the new record and no tombstone hiding it
+    reloaded = Store("users", "user")
+    assert reloaded.get(new["user_id"])["email"] == new["email"]
+    with open("users.deleted", encoding="utf-8") as f:
+        assert new["user_id"] not in f.read()
@@ -0,0 +1,76 @@
+# Python
+import threading
+
+# Pytest
+import pytest
+
+from test_durability import new_user
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    with TestClient(main2.app) as client:
+        yield client
+
+def test_a_retry_gets_the_same_response_back(client):
+    import main2
+
+    user = new_user()
+    headers = {"Idempotency-Key": "signup-1"}
+    first = client.post("/singup", json=user, headers=headers)
+
+    second = client.post("/singup", json=user, headers=headers)
+
+    assert first.status_code == second.status_code == 201
+    assert second.content == first.content
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    # Without the key the same signup runs again and finds the user
+    assert client.post("/singup", json=user).status_code == 409
+    assert main2.stores["users"].get(user["user_id"]) is not None
+
+def test_the_same_key_with_another_body_is_rejected(client):
+    import main2
+
+    headers = {"Idempotency-Key": "signup-2"}
+    assert client.post("/singup", json=new_user(), headers=headers).status_code == 201
+    other = new_user()
+
+    response = client.post("/singup", json=other, headers=headers)
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "¡This Idempotency-Key was used with another request!"
+    assert main2.stores["users"].get(other["user_id"]) is None
+
+def test_a_retry_while_the_request_runs_is_a_conflict(client, monkeypatch):
+    import main2
+
+    users = main2.stores["users"]
+    insert = users.insert
+    inserting, release = threading.Event(), threading.Event()
+
+    def slow_insert(data):
+        inserting.set()
+        release.wait(10)
+        return insert(data)
+
+    monkeypatch.setattr(users, "insert", slow_insert)
+    user = new_user()
+    headers = {"Idempotency-Key": "signup-3"}
+    statuses = []
+    first = threading.Thread(
+        target=lambda: statuses.append(client.post("/singup", json=user, headers=headers).status_code)
+    )
+    first.start()
+    assert inserting.wait(10)
+
+    response = client.post("/singup", json=user, headers=headers)
+    release.set()
+    first.join(10)
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == "¡This request is still in progress!"
+    assert statuses == [201]
+    assert client.post("/singup", json=user, headers=headers).headers["Idempotent-Replayed"] == "true"
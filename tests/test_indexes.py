@@ -0,0 +1,75 @@
+# Python
+import json
+import time
+import threading
+from uuid import uuid4
+
+def tweet(user_id):
+    return {
+        "tweet_id": str(uuid4()),
+        "content": "Hello",
+        "created_at": "2022-11-06 22:40:49",
+        "updated_at": None,
+        "by": {"user_id": user_id, "email": "user@example.com", "first_name": "A", "last_name": "B"},
+        "media": []
+    }
+
+def race(monkeypatch, store, build, write, sleep_before_read):
+    """
+    Runs write while build is reading the records of the store
+    """
+    all_records = store.all
+
+    def slow_all():
+        if sleep_before_read:
+            time.sleep(0.2)
+        records = all_records()
+        if not sleep_before_read:
+            time.sleep(0.2)
+        return records
+
+    monkeypatch.setattr(store, "all", slow_all)
+    thread = threading.Thread(target=build)
+    thread.start()
+    time.sleep(0.05)
+    write()
+    thread.join()
+    monkeypatch.setattr(store, "all", all_records)
+
+def test_a_write_during_the_first_build_is_counted_once(app_dir, monkeypatch):
+    import main2
+
+    with open("tweets.json", "w", encoding="utf-8") as f:
+        json.dump([], f)
+    store = main2.stores["tweets"]
+    user_id = str(uuid4())
+    store.insert(tweet(user_id))
+    write = lambda: store.insert(tweet(user_id))
+
+    race(monkeypatch, store, lambda: main2.tweets_by_user.get(user_id), write, False)
+    race(monkeypatch, store, main2.tweets_by_created_at.range, write, False)
+    race(monkeypatch, store, main2.stats.totals, write, True)
+
+    assert len(main2.tweets_by_user.get(user_id)) == 4
+    assert len(main2.tweets_by_created_at.range()) == 4
+    assert main2.stats.totals()["tweets"] == 4
+
+def test_the_last_posted_date_goes_back_when_the_newest_tweet_is_deleted(app_dir):
+    import main2
+
+    with open("tweets.json", "w", encoding="utf-8") as f:
+        json.dump([], f)
+    store = main2.stores["tweets"]
+    old, new = tweet(str(uuid4())), tweet(str(uuid4()))
+    new["created_at"] = "2023-01-01 10:00:00"
+    store.insert(old)
+    store.insert(new)
+    assert str(main2.stats.totals()["last_posted_at"]) == "2023-01-01 10:00:00"
+
+    store.remove(new["tweet_id"])
+
+    totals = main2.stats.totals()
+    assert str(totals["last_posted_at"]) == "2022-11-06 22:40:49"
+    assert totals["tweets"] == 1
+    store.remove(old["tweet_id"])
+    assert main2.stats.totals()["last_posted_at"] is None
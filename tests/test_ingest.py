@@ -0,0 +1,33 @@
+# Python
+import json
+from uuid import uuid4
+
+def test_validate_lines_saves_the_ids_in_canonical_form(app_dir):
+    from main2 import validate_lines
+
+    user_id, tweet_id, media_id = uuid4(), uuid4(), uuid4()
+    user = {
+        "user_id": user_id.hex.upper(),
+        "email": "user@example.com",
+        "first_name": "Santiago",
+        "last_name": "Tellez"
+    }
+    lines = [
+        json.dumps({"type": "user", **user, "password": "12345678"}),
+        json.dumps({
+            "type": "tweet",
+            "tweet_id": str(tweet_id).upper(),
+            "content": "Hello",
+            "by": user,
+            "media": [media_id.hex]
+        })
+    ]
+
+    records, errors = validate_lines(lines)
+
+    assert errors == []
+    assert records["users"][0]["user_id"] == str(user_id)
+    tweet = records["tweets"][0]
+    assert tweet["tweet_id"] == str(tweet_id)
+    assert tweet["by"]["user_id"] == str(user_id)
+    assert tweet["media"] == [str(media_id)]
@@ -0,0 +1,102 @@
+# Python
+from uuid import uuid4
+from hashlib import sha256
+
+# Pytest
+import pytest
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    with TestClient(main2.app) as client:
+        yield client
+
+def test_svg_uploads_are_rejected(client):
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+    response = client.post("/media", files={"image": ("x.svg", svg, "image/svg+xml")})
+
+    assert response.status_code == 415
+
+def real_png():
+    from io import BytesIO
+    Image = pytest.importorskip("PIL.Image")
+
+    output = BytesIO()
+    Image.new("RGB", (600, 400), "red").save(output, format="PNG")
+    return output.getvalue()
+
+def test_the_type_comes_from_the_content(client):
+    response = client.post("/media", files={"image": ("x.jpg", real_png(), "image/jpeg")})
+    assert response.status_code == 201
+    media = response.json()
+    assert media["content_type"] == "image/png"
+
+    response = client.get(f"/media/{media['media_id']}")
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+def test_big_uploads_are_rejected(client, monkeypatch):
+    import main2
+
+    monkeypatch.setattr(main2, "MEDIA_MAX_SIZE", 32)
+    response = client.post("/media", files={"image": ("x.png", PNG, "image/png")})
+
+    assert response.status_code == 413
+
+def test_broken_images_are_rejected(client):
+    pytest.importorskip("PIL.Image")
+
+    response = client.post("/media", files={"image": ("x.png", PNG, "image/png")})
+
+    assert response.status_code == 422
+
+def test_the_same_image_is_stored_once(client):
+    content = real_png()
+    first = client.post("/media", files={"image": ("a.png", content, "image/png")}).json()
+    second = client.post("/media", files={"image": ("b.png", content, "image/png")}).json()
+
+    assert second["media_id"] == first["media_id"]
+
+def test_variants_that_fail_are_logged_and_saved(client, caplog):
+    from concurrent.futures import Future
+    import main2
+
+    # Not uploaded, so the process pool doesn't save the real variants
+    media = {
+        "media_id": str(uuid4()),
+        "filename": "x.png",
+        "content_type": "image/png",
+        "size": len(PNG),
+        "sha256": sha256(PNG).hexdigest(),
+        "created_at": "2022-11-06 22:40:49",
+        "variants": {}
+    }
+    main2.stores["media"].insert(media)
+    future = Future()
+    future.set_exception(OSError("image file is truncated"))
+
+    main2.save_variants(media["media_id"], future)
+
+    assert "Couldn't make the variants" in caplog.text
+    saved = main2.stores["media"].get(media["media_id"])
+    assert saved["variants_error"] == "OSError: image file is truncated"
+    response = client.get(f"/media/{media['media_id']}", params={"variant": "thumb"})
+    assert response.json()["detail"] == "¡The variants of this image couldn't be made!"
+
+def test_the_variants_made_during_the_shutdown_are_saved(app_dir):
+    import json
+    from fastapi.testclient import TestClient
+    import main2
+
+    content = real_png()
+    with TestClient(main2.app) as client:
+        response = client.post("/media", files={"image": ("x.png", content, "image/png")})
+        assert response.status_code == 201
+
+    with open("media.json", encoding="utf-8") as f:
+        media = json.load(f)
+    assert set(media[-1]["variants"]) == set(main2.MEDIA_VARIANTS)
@@ -0,0 +1,63 @@
+# Python
+import os
+import sys
+import json
+from uuid import uuid4
+
+def user(**fields):
+    return {
+        "user_id": str(uuid4()),
+        "email": "user@example.com",
+        "first_name": "Santiago",
+        "last_name": "Tellez",
+        "birth_date": "1990-05-17",
+        "password": "1234",
+        **fields
+    }
+
+def tweet(author):
+    return {
+        "tweet_id": str(uuid4()),
+        "content": "Hello",
+        "created_at": "2022-11-06 22:40:49.298553",
+        "by": {"user_id": author["user_id"]}
+    }
+
+def migrate(monkeypatch, *args):
+    import migrate
+
+    monkeypatch.setattr(sys, "argv", ["migrate.py", "--output-dir", "out", "--workers", "1", *args])
+    return migrate.main()
+
+def write(file, records):
+    with open(f"{file}.json", "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+def read(file):
+    with open(os.path.join("out", f"{file}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def test_keeps_legacy_records_and_skips_deleted_tweets(app_dir, monkeypatch):
+    legacy, deleted_author = user(), user()
+    kept, deleted = tweet(legacy), tweet(deleted_author)
+    write("users", [legacy])
+    write("tweets", [kept, deleted])
+    write("media", [])
+    with open("tweets.deleted", "w", encoding="utf-8") as f:
+        f.write(f"{deleted['tweet_id']}\n")
+
+    assert migrate(monkeypatch) == 0
+    assert [u["user_id"] for u in read("users")] == [legacy["user_id"]]
+    assert [t["tweet_id"] for t in read("tweets")] == [kept["tweet_id"]]
+
+def test_invalid_records_are_only_dropped_when_asked(app_dir, monkeypatch):
+    valid = user()
+    write("users", [valid, user(email="not an email")])
+    write("tweets", [])
+    write("media", [])
+
+    assert migrate(monkeypatch) == 1
+    assert not os.path.exists(os.path.join("out", "users.json"))
+
+    assert migrate(monkeypatch, "--drop-invalid") == 1
+    assert [u["user_id"] for u in read("users")] == [valid["user_id"]]
@@ -0,0 +1,63 @@
+# Python
+import json
+
+# Pytest
+import pytest
+
+# Records of the repo's own data, saved before the current rules
+LEGACY_USER_ID = "3fa85f64-5717-4562-b3fc-2c963f66afa6"
+LEGACY_TWEET_ID = "5fa75f64-5717-4562-b3fc-2c963f66afa6"
+MERGE_PATCH = {"Content-Type": "application/merge-patch+json"}
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    with TestClient(main2.app) as client:
+        token = client.post("/login", data={"email": "user@example.com", "password": "string"}).json()
+        client.headers["Authorization"] = f"Bearer {token['access_token']}"
+        yield client
+
+def patch(client, path, body, **headers):
+    return client.patch(path, content=json.dumps(body), headers={**MERGE_PATCH, **headers})
+
+def test_a_legacy_user_can_be_patched(client):
+    response = patch(client, f"/users/{LEGACY_USER_ID}", {"first_name": "X"})
+
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "X"
+
+def test_a_legacy_tweet_can_be_patched(client):
+    response = patch(client, f"/tweets/{LEGACY_TWEET_ID}", {"content": "new"})
+
+    assert response.status_code == 200
+    assert response.json()["content"] == "new"
+    assert response.json()["by"]["first_name"] == "string"
+
+def test_the_patched_fields_are_still_validated(client):
+    response = patch(client, f"/users/{LEGACY_USER_ID}", {"password": "short"})
+    assert response.status_code == 422
+
+    response = patch(client, f"/users/{LEGACY_USER_ID}", {"first_name": None})
+    assert response.status_code == 422
+
+def test_null_removes_an_optional_field(client):
+    response = patch(client, f"/users/{LEGACY_USER_ID}", {"birth_date": None})
+
+    assert response.status_code == 200
+    assert response.json()["birth_date"] is None
+    assert client.get(f"/users/{LEGACY_USER_ID}").json()["birth_date"] is None
+
+def test_if_match_with_an_old_version_fails(client):
+    version = client.get(f"/users/{LEGACY_USER_ID}").headers["ETag"]
+    response = patch(client, f"/users/{LEGACY_USER_ID}", {"first_name": "A"}, **{"If-Match": version})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != version
+
+    response = patch(client, f"/users/{LEGACY_USER_ID}", {"first_name": "B"}, **{"If-Match": version})
+    assert response.status_code == 412
+    assert client.get(f"/users/{LEGACY_USER_ID}").json()["first_name"] == "A"
+
+    response = patch(client, f"/users/{LEGACY_USER_ID}", {"first_name": "B"}, **{"If-Match": "abc"})
+    assert response.status_code == 412
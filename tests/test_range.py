@@ -0,0 +1,54 @@
+# Python
+import json
+import time
+from uuid import uuid4
+
+# Pytest
+import pytest
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    for file in ("users", "tweets"):
+        with open(f"{file}.json", "w", encoding="utf-8") as f:
+            json.dump([], f)
+    with TestClient(main2.app) as client:
+        yield client
+
+def test_pages_dont_repeat_nor_skip_tweets_with_the_same_date(client):
+    import main2
+
+    by = {"user_id": str(uuid4()), "email": "user@example.com", "first_name": "A", "last_name": "B"}
+    tweets = [
+        {"tweet_id": str(uuid4()), "content": "Hello", "created_at": "2022-11-06 22:40:49",
+         "updated_at": None, "by": by, "media": []}
+        for _ in range(5)
+    ]
+    main2.stores["tweets"].insert_many(tweets)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/tweets", params=params)
+        assert response.status_code == 200
+        seen += [tweet["tweet_id"] for tweet in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(tweet["tweet_id"] for tweet in tweets)
+
+def test_the_default_created_at_is_the_time_of_the_post():
+    from main2 import Tweet
+
+    by = {"user_id": uuid4(), "email": "user@example.com", "first_name": "A", "last_name": "B"}
+    first = Tweet(tweet_id=uuid4(), content="Hello", by=by)
+    time.sleep(0.01)
+    second = Tweet(tweet_id=uuid4(), content="Hello", by=by)
+
+    assert first.created_at < second.created_at
+
+def test_a_broken_cursor_is_rejected(client):
+    assert client.get("/tweets", params={"cursor": "yesterday"}).status_code == 422
@@ -0,0 +1,103 @@
+# Python
+import time
+import threading
+
+LEGACY_TWEET_ID = "5fa75f64-5717-4562-b3fc-2c963f66afa6"
+
+def run_together(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def wait_for(condition):
+    deadline = time.monotonic() + 10
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+def test_concurrent_calls_for_a_key_run_once():
+    from main2 import SingleFlight
+
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        release.wait(10)
+        return object()
+
+    threads, results = run_together(8, lambda: flight.do("key", lookup))
+    wait_for(lambda: flight.metrics["requests"] == 8)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({id(result) for result in results}) == 1
+    assert flight.metrics == {"requests": 8, "executions": 1, "coalesced": 7}
+    assert flight.calls == {}
+
+def test_the_error_is_shared_and_the_next_call_runs_again():
+    from main2 import SingleFlight
+
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(10)
+        raise KeyError("gone")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", failing)
+        except KeyError as error:
+            errors.append(error)
+
+    threads, _ = run_together(4, call)
+    wait_for(lambda: flight.metrics["requests"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4
+    assert flight.do("key", lambda: "found") == "found"
+    assert flight.metrics["executions"] == 2
+
+def test_other_keys_arent_coalesced():
+    from main2 import SingleFlight
+
+    flight = SingleFlight()
+
+    assert [flight.do(key, lambda key=key: key) for key in ("a", "b", "a")] == ["a", "b", "a"]
+    assert flight.metrics == {"requests": 3, "executions": 3, "coalesced": 0}
+
+def test_concurrent_reads_of_a_tweet_show_in_the_metrics(app_dir, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main2
+
+    show_data = main2.show_data
+    release = threading.Event()
+
+    def slow_show_data(*args):
+        release.wait(10)
+        return show_data(*args)
+
+    monkeypatch.setattr(main2, "show_data", slow_show_data)
+    with TestClient(main2.app) as client:
+        before = client.get("/metrics").json()["single_flight"]
+        threads, responses = run_together(4, lambda: client.get(f"/tweets/{LEGACY_TWEET_ID}"))
+        wait_for(lambda: main2.single_flight.metrics["requests"] - before["requests"] == 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+        after = client.get("/metrics").json()["single_flight"]
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.content for response in responses}) == 1
+    assert after["executions"] - before["executions"] == 1
+    assert after["coalesced"] - before["coalesced"] == 3
@@ -0,0 +1,48 @@
+# Python
+import gzip
+import json
+from uuid import uuid4
+
+# Pytest
+import pytest
+
+ADMIN_TOKEN = "admin-token"
+
+@pytest.fixture
+def client(app_dir, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main2
+
+    monkeypatch.setattr(main2, "ADMIN_TOKEN", ADMIN_TOKEN)
+    with TestClient(main2.app, headers={"X-Admin-Token": ADMIN_TOKEN}) as client:
+        yield client
+
+def snapshot(header, lines):
+    return gzip.compress("\n".join(map(json.dumps, [header, *lines])).encode("utf-8"))
+
+def test_restore_writes_the_json_before_clearing_the_tombstones(client):
+    import main2
+
+    tweets = main2.stores["tweets"]
+    tweet_id = tweets.all()[0]["tweet_id"]
+    tweets.remove(tweet_id)
+    content = client.get("/admin/snapshot").content
+
+    response = client.post("/admin/snapshot", content=content)
+
+    assert response.status_code == 200
+    with open("tweets.deleted", encoding="utf-8") as f:
+        assert f.read() == ""
+    with open("tweets.json", encoding="utf-8") as f:
+        assert tweet_id not in {tweet["tweet_id"] for tweet in json.load(f)}
+    assert "event: reset" in main2.broadcaster.buffer[-1][1]
+
+@pytest.mark.parametrize("header, lines", [
+    ({"snapshot": 1, "counts": {"users": 1}}, [{"file": "users", "data": "not a record"}]),
+    ({"snapshot": 1, "counts": {"users": 1}}, [{"file": "users", "data": {"user_id": [1]}}]),
+    ({"snapshot": 1}, [{"file": "users", "data": {"user_id": str(uuid4())}}])
+])
+def test_restore_rejects_a_broken_snapshot(client, header, lines):
+    response = client.post("/admin/snapshot", content=snapshot(header, lines))
+
+    assert response.status_code == 422
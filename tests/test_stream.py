@@ -0,0 +1,50 @@
+# Python
+import asyncio
+
+def subscribe(broadcaster, last_event_id):
+    async def run():
+        queue, replay, last_id = broadcaster.subscribe(last_event_id)
+        broadcaster.unsubscribe(queue)
+        return replay
+    return asyncio.run(run())
+
+def test_an_id_of_before_a_restart_gets_a_reset():
+    from main2 import Broadcaster
+
+    before = Broadcaster(10, 100)
+    for number in range(5):
+        before.publish("created", {"number": number})
+    old_id = f"{before.epoch}-5"
+
+    after = Broadcaster(10, 100)
+    for number in range(10):
+        after.publish("created", {"number": number})
+
+    replay = subscribe(after, old_id)
+    assert len(replay) == 1 and "event: reset" in replay[0]
+    assert "event: reset" in subscribe(after, "500")[0]
+
+    replay = subscribe(after, f"{after.epoch}-8")
+    assert [message.split("\n")[0] for message in replay] == [f"id: {after.epoch}-9", f"id: {after.epoch}-10"]
+
+def test_an_open_stream_doesnt_block_the_shutdown(app_dir):
+    import signal
+    import threading
+    import subprocess
+    from urllib.request import urlopen
+    from test_durability import free_port, start_server
+
+    port = free_port()
+    server = start_server(app_dir, port)
+    stream = urlopen(f"http://127.0.0.1:{port}/tweets/stream", timeout=30)
+    reader = threading.Thread(target=stream.read)
+    reader.start()
+    try:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        raise AssertionError("The server waited for the open stream")
+    finally:
+        reader.join(timeout=10)
+        stream.close()
@@ -0,0 +1,51 @@
+# Python
+import json
+from uuid import uuid4
+
+# Pytest
+import pytest
+
+@pytest.fixture
+def client(app_dir):
+    from fastapi.testclient import TestClient
+    import main2
+
+    for file in ("users", "tweets"):
+        with open(f"{file}.json", "w", encoding="utf-8") as f:
+            json.dump([], f)
+    with TestClient(main2.app) as client:
+        yield client
+
+def test_tweet_reads_show_the_current_author(client):
+    user = {
+        "user_id": str(uuid4()),
+        "email": "user@example.com",
+        "first_name": "A",
+        "last_name": "Tellez",
+        "birth_date": "1990-05-17",
+        "password": "12345678"
+    }
+    assert client.post("/singup", json=user).status_code == 201
+    token = client.post("/login", data={"email": user["email"], "password": user["password"]}).json()
+    headers = {"Authorization": f"Bearer {token['access_token']}"}
+    tweet_id = str(uuid4())
+    response = client.post("/post", headers=headers, json={
+        "tweet_id": tweet_id,
+        "content": "Hello",
+        "created_at": "2022-11-06T22:40:49",
+        "by": user
+    })
+    assert response.status_code == 201
+    assert client.get("/").json()[0]["by"]["first_name"] == "A"
+
+    response = client.patch(
+        f"/users/{user['user_id']}",
+        content=json.dumps({"first_name": "Z"}),
+        headers={**headers, "Content-Type": "application/merge-patch+json"}
+    )
+    assert response.status_code == 200
+
+    assert client.get("/").json()[0]["by"]["first_name"] == "Z"
+    assert client.get(f"/tweets/{tweet_id}").json()["by"]["first_name"] == "Z"
+    assert client.get("/tweets:batch", params={"ids": [tweet_id]}).json()[0]["tweet"]["by"]["first_name"] == "Z"
+    assert client.get("/tweets").json()[0]["by"]["first_name"] == "Z"